@@ -0,0 +1,128 @@
+import asyncio
+import os
+import time
+
+
+MAX_BOTS_PER_HOST    = int(os.getenv("MAX_BOTS_PER_HOST", "0"))            # 0 = no bot count limit
+HOST_CPU_BUDGET      = float(os.getenv("HOST_CPU_BUDGET", "0")) or (os.cpu_count() or 1) * 0.85   # cores
+HOST_RSS_BUDGET_MB   = float(os.getenv("HOST_RSS_BUDGET_MB", "0"))         # 0 = 85% of MemTotal
+ADMISSION_INTERVAL   = float(os.getenv("ADMISSION_INTERVAL", "5"))
+ADMISSION_RETRY      = int(os.getenv("ADMISSION_RETRY", "10"))
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE   = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def mem_total_mb() :
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return 0.0
+
+
+def sample_process(pid) :
+    """(cpu seconds, rss bytes) for a pid from /proc, or None if it is gone."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            rss_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    # fields[0] is state (field 3), so utime/stime (fields 14/15) are at 11/12
+    cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    return cpu, rss_pages * PAGE_SIZE
+
+
+class AdmissionController :
+    """Refuses bot starts when the host is over its bot, CPU or memory budget.
+
+    `pids()` returns the bot process ids to sample and `bots()` the number
+    of live bots. Samples are taken every `interval` seconds; `on_change`
+    is awaited with the new availability whenever the host crosses its
+    budget in either direction.
+    """
+
+    def __init__(self, pids, bots, max_bots=MAX_BOTS_PER_HOST, cpu_budget=HOST_CPU_BUDGET,
+                 rss_budget_mb=HOST_RSS_BUDGET_MB, interval=ADMISSION_INTERVAL) :
+        self.pids          = pids
+        self.bots          = bots
+        self.max_bots      = max_bots
+        self.cpu_budget    = cpu_budget
+        self.rss_budget    = (rss_budget_mb or mem_total_mb() * 0.85) * 1024 * 1024
+        self.interval      = interval
+        self.cpu           = 0.0        # cores in use by bots
+        self.rss           = 0          # bytes held by bots
+        self.per_bot       = {}         # pid -> {"cpu": cores, "rss": bytes}
+        self.available     = True
+        self._last         = {}         # pid -> (wall time, cpu seconds)
+        self._task         = None
+        self._on_change    = None
+
+    def start(self, on_change=None) :
+        self._on_change = on_change
+        self._task      = asyncio.create_task(self._run())
+
+    async def stop(self) :
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) :
+        while True:
+            self.sample()
+            available = self.admit()[0]
+            if available != self.available:
+                self.available = available
+                print(f"Host {'accepting' if available else 'saturated'}: {self.summary()}")
+                if self._on_change is not None:
+                    try:
+                        await self._on_change(available)
+                    except Exception as e:
+                        print(f"Error updating availability: {e}")
+            await asyncio.sleep(self.interval)
+
+    def sample(self) :
+        now      = time.monotonic()
+        per_bot  = {}
+        samples  = {}
+        for pid in self.pids():
+            sample = sample_process(pid)
+            if sample is None:
+                continue
+            cpu_seconds, rss = sample
+            samples[pid] = (now, cpu_seconds)
+            cores = 0.0
+            if pid in self._last:
+                then, cpu_then = self._last[pid]
+                if now > then:
+                    cores = max(0.0, (cpu_seconds - cpu_then) / (now - then))
+            per_bot[pid] = {"cpu": cores, "rss": rss}
+        self._last   = samples
+        self.per_bot = per_bot
+        self.cpu     = sum(p["cpu"] for p in per_bot.values())
+        self.rss     = sum(p["rss"] for p in per_bot.values())
+
+    def admit(self) :
+        bots = self.bots()
+        if self.max_bots > 0 and bots >= self.max_bots:
+            return False, f"host is at its limit of {self.max_bots} bots"
+        # project one more bot at the current per-bot average
+        cpu_each = self.cpu / bots if bots else 0.0
+        rss_each = self.rss / bots if bots else 0.0
+        if self.cpu + cpu_each > self.cpu_budget:
+            return False, f"host CPU budget exhausted ({self.cpu:.2f}/{self.cpu_budget:.2f} cores)"
+        if self.rss_budget > 0 and self.rss + rss_each > self.rss_budget:
+            return False, f"host memory budget exhausted ({self.rss / 2**20:.0f}/{self.rss_budget / 2**20:.0f} MB)"
+        return True, None
+
+    def summary(self) :
+        return f"bots={self.bots()} cpu={self.cpu:.2f}/{self.cpu_budget:.2f} rss={self.rss / 2**20:.0f}/{self.rss_budget / 2**20:.0f}MB"
@@ -0,0 +1,77 @@
+"""Delay line check: every audio chunk comes out of the delay buffer exactly once.
+
+Feeds numbered 10 ms chunks through PcmAudioBuffer and AudioBuffer on a
+simulated clock, reads one chunk per append the way the bot does, and
+counts chunks read twice in a row (repeats) and chunks jumped over
+(skips) once the delay has filled. Any repeat or skip is an audible
+glitch, so the exit status is 1 when one is found.
+
+    python bench/delay_check.py
+    python bench/delay_check.py --delays 1,2,3.3 --chunks 900 --arrival-jitter-ms 4
+"""
+
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import echo_bot                                          # noqa: E402
+from   echo_bench import SimClock, FakeAudioData, SAMPLE_RATE, AUDIO_CHUNK    # noqa: E402
+
+
+def chunk_index(buffer, item) :
+    if isinstance(item, echo_bot.PcmChunk) :
+        return item.start // AUDIO_CHUNK
+    return item.data.index
+
+
+def run(audio_mode, clock_mode, delay, chunks, reads, arrival_jitter, seed=1) :
+    clock  = SimClock()
+    echo_bot.time = clock
+    rng    = random.Random(seed)
+    media  = echo_bot.MediaClock(mode=clock_mode)
+    buffer = echo_bot.PcmAudioBuffer(clock=media.audio()) if audio_mode == "pcm" else echo_bot.AudioBuffer(clock=media.audio())
+    buffer.delay(delay)
+
+    start   = clock.now
+    indices = []
+    for index in range(chunks) :
+        clock.now = start + index * 0.01 + rng.uniform(-arrival_jitter, arrival_jitter)
+        data       = FakeAudioData(bytes(AUDIO_CHUNK * 2))
+        data.index = index
+        buffer.append(data)
+        indices.append( chunk_index(buffer, buffer.getFromQueue()) )
+
+    tail    = indices[-reads:]
+    repeats = sum(1 for a, b in zip(tail, tail[1:]) if b == a)
+    skips   = sum(1 for a, b in zip(tail, tail[1:]) if b > a + 1)
+    return repeats, skips
+
+
+def main() :
+    parser = argparse.ArgumentParser(description="Delay buffer repeat / skip check")
+    parser.add_argument("--delays", default="1,2,3.3", help="comma separated delays in seconds")
+    parser.add_argument("--chunks", type=int, default=900, help="10 ms chunks fed per run")
+    parser.add_argument("--reads", type=int, default=500, help="last reads checked for repeats and skips")
+    parser.add_argument("--arrival-jitter-ms", type=float, default=0.0, help="random +- offset of each chunk's arrival")
+    args = parser.parse_args()
+
+    real_time = echo_bot.time
+    failed    = False
+    try :
+        for audio_mode in ("pcm", "frames") :
+            for clock_mode in ("media", "wall") :
+                for delay in (float(d) for d in args.delays.split(",")) :
+                    repeats, skips = run(audio_mode, clock_mode, delay, args.chunks, args.reads, args.arrival_jitter_ms / 1000.0)
+                    ok      = repeats == 0 and skips == 0
+                    failed |= not ok
+                    print(f"{'ok  ' if ok else 'FAIL'} {audio_mode:6} {clock_mode:5} delay {delay:4.1f} s: {repeats} repeats, {skips} skips")
+    finally :
+        echo_bot.time = real_time
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""Offline benchmark for the echo media path.
+
+Feeds synthetic Daily-like audio chunks (48 kHz mono, 10 ms) and video
+frames (30 fps) through AudioBuffer / PcmAudioBuffer, VideoBuffer,
+BufferedVideoData.frames() and the EchoBot writer loop into fake
+camera and microphone sinks. No Daily room or network is needed.
+
+    python bench/echo_bench.py
+    python bench/echo_bench.py --delays 0,1,5 --resolutions 1280x720 --formats RGBA --seconds 20
+    python bench/echo_bench.py --realtime 5 --json bench_output.json
+
+Throughput runs on a simulated clock and reports CPU seconds per media
+second (and the bots one core sustains at that cost), per-frame latency
+percentiles from append to sink write, and memory growth. --realtime
+additionally runs the threaded writer loops at wall-clock pace.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import echo_bot                              # noqa: E402
+
+
+SAMPLE_RATE   = 48000
+AUDIO_CHUNK   = 480          # 10 ms
+FRAME_RATE    = 30
+CAMERA_WIDTH  = 360
+CAMERA_HEIGHT = 640
+
+
+class FakeAudioData :
+    def __init__(self, audio_frames, sample_rate=SAMPLE_RATE, num_channels=1) :
+        self.audio_frames     = audio_frames
+        self.sample_rate      = sample_rate
+        self.num_channels     = num_channels
+        self.bits_per_sample  = 16
+        self.num_audio_frames = len(audio_frames) // (2 * num_channels)
+
+
+class FakeVideoFrame :
+    def __init__(self, buffer, width, height, color_format, timestamp_us) :
+        self.buffer       = buffer
+        self.width        = width
+        self.height       = height
+        self.color_format = color_format
+        self.timestamp_us = timestamp_us
+
+
+class FakeSink :
+    """Stands in for VirtualCameraDevice / VirtualMicrophoneDevice and records write times."""
+
+    def __init__(self, width=CAMERA_WIDTH, height=CAMERA_HEIGHT, color_format="RGBA", cost=0.0) :
+        self.width        = width
+        self.height       = height
+        self.color_format = color_format
+        self.cost         = cost       # extra seconds each write_frame spins, to simulate a loaded host
+        self.writes       = []
+
+    def write_frame(self, frame) :
+        if self.cost :
+            until = time.perf_counter() + self.cost
+            while time.perf_counter() < until :
+                pass
+        self.writes.append( (time.perf_counter(), len(frame)) )
+
+    def write_frames(self, frames) :
+        self.writes.append( (time.perf_counter(), len(frames)) )
+        return len(frames) // 2
+
+
+class SimClock :
+    """Replaces the time module in echo_bot so buffers see simulated arrival times."""
+
+    perf_counter = staticmethod(time.perf_counter)
+    sleep        = staticmethod(time.sleep)
+
+    def __init__(self) :
+        self.now = 1_000_000.0
+
+    def time(self) :
+        return self.now
+
+    def monotonic(self) :
+        return self.now
+
+
+def rss_bytes() :
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+
+def source_frames(width, height, color_format, count=8) :
+    channels = 3 if color_format in ("RGB", "BGR") else 4
+    rng      = np.random.default_rng(0)
+    return [rng.integers(0, 255, (height, width, channels), dtype=np.uint8).tobytes() for _ in range(count)]
+
+
+def percentiles(values) :
+    if not values :
+        return {"p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {"p50": p50 * 1000, "p90": p90 * 1000, "p99": p99 * 1000, "max": max(values) * 1000}
+
+
+def make_buffers(delay, audio_mode, camera, sync) :
+    clock   = echo_bot.MediaClock()
+    playout = echo_bot.PlayoutClock(clock) if sync else None
+    if audio_mode == "pcm" :
+        audio = echo_bot.PcmAudioBuffer(5.0, maxsize=15, clock=clock.audio())
+    else :
+        audio = echo_bot.AudioBuffer(5.0, maxsize=15, clock=clock.audio())
+    video = echo_bot.VideoBuffer(camera, 5.0, clock=clock.video(), playout=playout)
+    audio.delay(delay)
+    video.delay(delay)
+    return audio, video, playout
+
+
+def drain(buffer, sink_write, latencies, arrived, on_write=None) :
+    if getattr(buffer, "playout", None) is not None :
+        data = buffer.frame_at( buffer.playout.position() )
+    else :
+        data = buffer.getFromQueue()
+    if data :
+        echo_bot.timed_write(buffer.metrics, data, sink_write)
+        latencies.append( time.perf_counter() - arrived )
+        if on_write is not None :
+            on_write( data )
+
+
+def run_throughput(delay, width, height, color_format, seconds, audio_mode, sync) :
+    clock         = SimClock()
+    echo_bot.time = clock
+    try:
+        camera, microphone = FakeSink(), FakeSink()
+        audio, video, playout = make_buffers(delay, audio_mode, camera, sync)
+        frames             = source_frames(width, height, color_format)
+        pcm                = np.zeros(AUDIO_CHUNK, dtype=np.int16).tobytes()
+        on_audio_write     = playout.audio_written if playout is not None else None
+        audio_latency, video_latency = [], []
+
+        steps       = int((seconds + delay) * 100)
+        video_every = 100.0 / FRAME_RATE
+        next_video  = 0.0
+
+        tracemalloc.start()
+        rss_start   = rss_bytes()
+        cpu_start   = time.process_time()
+        for step in range(steps) :
+            clock.now += 0.01
+            arrived = time.perf_counter()
+            audio.append( FakeAudioData(pcm) )
+            drain(audio, microphone.write_frames, audio_latency, arrived, on_audio_write)
+            if step >= next_video :
+                next_video += video_every
+                arrived = time.perf_counter()
+                video.append( FakeVideoFrame(frames[step % len(frames)], width, height, color_format, int(clock.now * 1e6)) )
+                drain(video, camera.write_frame, video_latency, arrived)
+        cpu = time.process_time() - cpu_start
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss_growth = rss_bytes() - rss_start
+    finally:
+        echo_bot.time = time
+
+    media_seconds = steps / 100.0
+    load          = cpu / media_seconds
+    return {
+        "delay"          : delay,
+        "resolution"     : f"{width}x{height}",
+        "format"         : color_format,
+        "audio_mode"     : audio_mode,
+        "sync"           : sync,
+        "cpu_per_second" : load,
+        "bots_per_core"  : (1.0 / load) if load > 0 else float("inf"),
+        "audio_latency"  : percentiles(audio_latency),
+        "video_latency"  : percentiles(video_latency),
+        "traced_peak_mb" : traced_peak / 2**20,
+        "rss_growth_mb"  : rss_growth / 2**20,
+        "audio_buffer_mb": audio.buffer_bytes() / 2**20,
+        "video_buffer_mb": video.buffer_bytes() / 2**20,
+        "video_writes"   : len(camera.writes),
+        "audio_writes"   : len(microphone.writes),
+        "av_skew_ms"     : video.metrics.skew * 1000,
+        "passthrough"    : video._transform.passthrough,
+    }
+
+
+def run_realtime(delay, width, height, color_format, seconds, audio_mode, sync, write_cost=0.0, write_ms=echo_bot.AUDIO_WRITE_MS, arrival_jitter=0.0,
+                 jitter_target_ms=echo_bot.AUDIO_JITTER_MS) :
+    camera, microphone = FakeSink(cost=write_cost), FakeSink()
+    audio, video, playout = make_buffers(delay, audio_mode, camera, sync)
+    frames             = source_frames(width, height, color_format)
+    pcm                = np.zeros(AUDIO_CHUNK, dtype=np.int16).tobytes()
+    quit               = threading.Event()
+
+    skews   = []
+    if playout is not None :
+        video_writer = threading.Thread(target=echo_bot.run_playout, args=(video, camera.write_frame, quit.is_set),
+                                        kwargs={"on_idle": lambda : skews.append(video.metrics.skew)})
+    else :
+        video_writer = threading.Thread(target=echo_bot.run_writer, args=(video, camera.write_frame, quit.is_set),
+                                        kwargs={"quality": video.quality})
+    if write_ms > 10 :
+        jitter       = echo_bot.AudioJitterBuffer(audio.metrics, write_ms=write_ms, target_ms=jitter_target_ms)
+        audio_writer = threading.Thread(target=echo_bot.run_audio_output, args=(audio, jitter, microphone.write_frames, quit.is_set),
+                                        kwargs={"on_write": playout.audio_written_at if playout is not None else None})
+    else :
+        audio_writer = threading.Thread(target=echo_bot.run_writer, args=(audio, microphone.write_frames, quit.is_set),
+                                        kwargs={"on_write": playout.audio_written if playout is not None else None})
+    writers = [audio_writer, video_writer]
+    for writer in writers :
+        writer.start()
+
+    def feed_audio() :
+        # chunks are due every 10 ms; arrival_jitter delays each by up to that many seconds
+        rng   = np.random.default_rng(1)
+        start = time.perf_counter()
+        for step in range(int(seconds * 100)) :
+            audio.append( FakeAudioData(pcm) )
+            due = start + (step + 1) * 0.01 + rng.uniform(0.0, arrival_jitter)
+            time.sleep( max(0.0, due - time.perf_counter()) )
+
+    def feed_video() :
+        start = time.perf_counter()
+        for step in range(int(seconds * FRAME_RATE)) :
+            video.append( FakeVideoFrame(frames[step % len(frames)], width, height, color_format, int(time.time() * 1e6)) )
+            time.sleep( max(0.0, start + (step + 1) / FRAME_RATE - time.perf_counter()) )
+
+    cpu_start = time.process_time()
+    feeders   = [threading.Thread(target=feed_audio), threading.Thread(target=feed_video)]
+    for feeder in feeders :
+        feeder.start()
+    for feeder in feeders :
+        feeder.join()
+    quit.set()
+    for writer in writers :
+        writer.join()
+    cpu = time.process_time() - cpu_start
+
+    def intervals(writes) :
+        times = [t for t, _ in writes]
+        return percentiles(list(np.diff(times))) if len(times) > 1 else percentiles([])
+
+    return {
+        "delay"               : delay,
+        "resolution"          : f"{width}x{height}",
+        "format"              : color_format,
+        "audio_mode"          : audio_mode,
+        "sync"                : sync,
+        "arrival_jitter_ms"   : arrival_jitter * 1000,
+        "jitter_target_ms"    : jitter_target_ms if write_ms > 10 else None,
+        "cpu_per_second"      : cpu / seconds,
+        "video_fps"           : len(camera.writes) / seconds,
+        "audio_writes_per_sec": len(microphone.writes) / seconds,
+        "video_write_interval": intervals(camera.writes),
+        "audio_write_interval": intervals(microphone.writes),
+        "video_drops"         : video.metrics.drops,
+        "audio_drops"         : audio.metrics.drops,
+        "video_duplicates"    : video.metrics.duplicates,
+        "audio_underruns"     : audio.metrics.underruns,
+        "audio_overruns"      : audio.metrics.overruns,
+        "quality_level"       : video.quality.level,
+        "quality_changes"     : video.quality.changes,
+        "av_skew"             : percentiles([abs(skew) for skew in skews]),
+    }
+
+
+def main() :
+    parser = argparse.ArgumentParser(description="Offline echo_bot media path benchmark")
+    parser.add_argument("--delays", default="0,0.5,1,2.5,5", help="comma separated delays in seconds")
+    parser.add_argument("--resolutions", default="360x640,640x360,1280x720", help="comma separated WIDTHxHEIGHT source sizes")
+    parser.add_argument("--formats", default="RGBA,BGRA", help="comma separated source color formats")
+    parser.add_argument("--audio-mode", default=echo_bot.AUDIO_BUFFER_MODE, choices=["pcm", "frames"])
+    parser.add_argument("--sync", default=echo_bot.AV_SYNC_MODE, choices=["audio", "off"], help="A/V sync mode")
+    parser.add_argument("--seconds", type=float, default=10.0, help="media seconds per throughput run, after the delay fills")
+    parser.add_argument("--realtime", type=float, default=0.0, help="also run threaded writers at wall-clock pace for this many seconds")
+    parser.add_argument("--audio-write-ms", type=int, default=echo_bot.AUDIO_WRITE_MS, help="microphone write size; 10 writes each chunk as it arrives")
+    parser.add_argument("--arrival-jitter-ms", type=float, default=0.0, help="random extra delay of each realtime audio chunk's arrival")
+    parser.add_argument("--jitter-target-ms", type=int, default=echo_bot.AUDIO_JITTER_MS, help="audio the jitter buffer holds before playback (AUDIO_JITTER_MS)")
+    parser.add_argument("--video-write-ms", type=float, default=0.0, help="extra cost of each realtime camera write, to exercise adaptive quality")
+    parser.add_argument("--json", default="", help="write results to this file as JSON")
+    args = parser.parse_args()
+
+    delays      = [float(d) for d in args.delays.split(",")]
+    resolutions = [tuple(int(v) for v in r.split("x")) for r in args.resolutions.split(",")]
+    formats     = args.formats.split(",")
+    sync        = args.sync == "audio"
+    results     = {"throughput": [], "realtime": []}
+
+    print(f"{'delay':>5} {'source':>9} {'fmt':>4} {'cpu/s':>6} {'bots/core':>9} {'video p50/p99 ms':>17} {'audio p99 ms':>12} {'peak MB':>8} {'rss +MB':>8}")
+    for width, height in resolutions :
+        for color_format in formats :
+            for delay in delays :
+                r = run_throughput(delay, width, height, color_format, args.seconds, args.audio_mode, sync)
+                results["throughput"].append(r)
+                print(f"{delay:5.1f} {r['resolution']:>9} {color_format:>4} {r['cpu_per_second']:6.3f} {r['bots_per_core']:9.1f} "
+                      f"{r['video_latency']['p50']:8.2f}/{r['video_latency']['p99']:<8.2f} {r['audio_latency']['p99']:12.3f} "
+                      f"{r['traced_peak_mb']:8.1f} {r['rss_growth_mb']:8.1f}")
+
+    if args.realtime > 0 :
+        print(f"\nrealtime {args.realtime:.0f}s")
+        print(f"{'delay':>5} {'source':>9} {'fmt':>4} {'cpu/s':>6} {'fps':>5} {'video gap p99 ms':>16} {'drops v/a':>9} {'dups':>5} {'skew p99 ms':>11} {'quality':>7} {'mic/s':>5} {'under/over':>10}")
+        for width, height in resolutions :
+            for color_format in formats :
+                for delay in delays :
+                    r = run_realtime(delay, width, height, color_format, args.realtime, args.audio_mode, sync,
+                                     args.video_write_ms / 1000.0, args.audio_write_ms, args.arrival_jitter_ms / 1000.0,
+                                     args.jitter_target_ms)
+                    results["realtime"].append(r)
+                    print(f"{delay:5.1f} {r['resolution']:>9} {color_format:>4} {r['cpu_per_second']:6.3f} {r['video_fps']:5.1f} "
+                          f"{r['video_write_interval']['p99']:16.2f} {r['video_drops']:>4}/{r['audio_drops']:<4} "
+                          f"{r['video_duplicates']:5} {r['av_skew']['p99']:11.2f} {r['quality_level']:7} "
+                          f"{r['audio_writes_per_sec']:5.0f} {r['audio_underruns']:>5}/{r['audio_overruns']:<4}")
+
+    if args.json :
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""FlyClient check against a local stand-in for the Fly Machines API.
+
+Serves a scripted machines API from aiohttp.web on localhost and drives
+FlyClient through it: retries of a GET on 5xx, no retry of a POST on
+5xx, a POST retried on 429, ETag / If-None-Match revalidation of the
+machine list, and the image TTL cache. No Fly token or network is needed.
+
+    python bench/fly_api_check.py
+
+The exit status is 1 when any check fails.
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+from   aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fly_api import FlyApiError, FlyClient      # noqa: E402
+
+
+APP      = "bot-app"
+IMAGE    = "registry.fly.io/bot-app:deployment-1"
+MACHINES = [{"id": "m1", "state": "started", "config": {"image": IMAGE}}]
+ETAG     = '"machines-1"'
+
+
+class StandIn :
+    """Machines API that answers from per-route scripts of status codes."""
+
+    def __init__(self) :
+        self.scripts = {}       # (method, path) -> statuses still to answer before 200
+        self.hits    = {}       # (method, path) -> requests seen
+        self.headers = []       # If-None-Match of each machine list request
+
+    def script(self, method, path, *statuses) :
+        self.scripts[(method, path)] = list(statuses)
+        self.hits[(method, path)]    = 0
+
+    async def handle(self, request) :
+        key = (request.method, request.path)
+        self.hits[key] = self.hits.get(key, 0) + 1
+        statuses = self.scripts.get(key)
+        if statuses :
+            status = statuses.pop(0)
+            return web.Response(status=status, text=f"scripted {status}")
+        if request.path == f"/apps/{APP}/machines" and request.method == "GET" :
+            self.headers.append(request.headers.get("If-None-Match"))
+            if request.headers.get("If-None-Match") == ETAG :
+                return web.Response(status=304)
+            return web.json_response(MACHINES, headers={"ETag": ETAG})
+        return web.json_response({"id": "m2"})
+
+
+async def run_checks(client, stand_in) :
+    results = []
+
+    def check(name, ok, detail) :
+        results.append(ok)
+        print(f"{'ok  ' if ok else 'FAIL'} {name}: {detail}")
+
+    list_path = f"/apps/{APP}/machines"
+
+    stand_in.script("GET", list_path, 503, 502)
+    machines = await client.machines()
+    hits     = stand_in.hits[("GET", list_path)]
+    check("GET retried on 5xx", machines == MACHINES and hits == 3, f"{hits} requests")
+
+    stand_in.script("POST", list_path, 500)
+    try :
+        await client.create_machine({"image": IMAGE})
+        raised = False
+    except FlyApiError as e :
+        raised = e.status == 500
+    hits = stand_in.hits[("POST", list_path)]
+    check("POST not retried on 5xx", raised and hits == 1, f"{hits} requests, raised={raised}")
+
+    stand_in.script("POST", f"{list_path}/m1", 429)
+    data = await client.update_machine("m1", {"image": IMAGE})
+    hits = stand_in.hits[("POST", f"{list_path}/m1")]
+    check("POST retried on 429", data == {"id": "m2"} and hits == 2, f"{hits} requests")
+
+    stand_in.script("GET", list_path)
+    machines = await client.machines()
+    check("machine list revalidated", machines == MACHINES and stand_in.headers[-1] == ETAG,
+          f"If-None-Match {stand_in.headers[-1]}, {stand_in.hits[('GET', list_path)]} request")
+
+    stand_in.script("GET", list_path)
+    await client.image()
+    await client.image()
+    cached = stand_in.hits[("GET", list_path)]
+    await asyncio.sleep(client.image_ttl * 1.5)
+    image  = await client.image()
+    stale  = stand_in.hits[("GET", list_path)]
+    check("image cached for its TTL", image == IMAGE and cached == 0 and stale == 1,
+          f"{cached} requests within the TTL, {stale} after it")
+
+    return all(results)
+
+
+async def main() :
+    stand_in = StandIn()
+    app      = web.Application()
+    app.router.add_route("*", "/{tail:.*}", stand_in.handle)
+    runner   = web.AppRunner(app)
+    await runner.setup()
+    site     = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port     = runner.addresses[0][1]
+
+    client = FlyClient(f"http://127.0.0.1:{port}", APP, "token", image_ttl=0.2, retries=3, backoff=0.01)
+    start  = time.perf_counter()
+    try :
+        async with aiohttp.ClientSession() as session :
+            client.open(session)
+            passed = await run_checks(client, stand_in)
+    finally :
+        await runner.cleanup()
+
+    print(f"{'all checks passed' if passed else 'checks failed'} in {time.perf_counter() - start:.2f} s")
+    return passed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
@@ -0,0 +1,90 @@
+"""Startup profile for bot processes.
+
+Imports each bot module in fresh interpreters, the way a process-mode
+bot starts, and reports the median total import time, peak RSS after
+import, and the slowest modules from `python -X importtime`.
+
+    python bench/startup_bench.py
+    python bench/startup_bench.py --modules silent_bot --runs 9 --budget-ms 60
+    python bench/startup_bench.py --json startup.json
+
+With --budget-ms the exit status is 1 when any module's median import
+time goes over budget, so the profile can gate a change.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = "import resource, time; start = time.perf_counter(); import {module}; " \
+        "print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+
+
+def measure(module) :
+    output = subprocess.run([sys.executable, "-c", PROBE.format(module=module)],
+                            cwd=ROOT, capture_output=True, text=True, check=True).stdout.split()
+    return float(output[0]), int(output[1]) * 1024
+
+
+def importtime(module) :
+    # {module: (self us, cumulative us)} from -X importtime
+    stderr  = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                             cwd=ROOT, capture_output=True, text=True, check=True).stderr
+    modules = {}
+    for line in stderr.splitlines() :
+        if not line.startswith("import time:") or "self [us]" in line :
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def profile(module, runs, top) :
+    samples = [measure(module) for _ in range(runs)]
+    modules = importtime(module)
+    slowest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    return {
+        "module"    : module,
+        "import_ms" : statistics.median(s[0] for s in samples) * 1000,
+        "rss_mb"    : statistics.median(s[1] for s in samples) / 2**20,
+        "modules"   : len(modules),
+        "heavy"     : sorted(name for name in ("numpy", "cv2", "PIL", "urllib.request", "daily") if name in modules),
+        "slowest"   : [{"name": name, "self_ms": s / 1000, "cumulative_ms": c / 1000} for name, (s, c) in slowest],
+    }
+
+
+def main() :
+    parser = argparse.ArgumentParser(description="Bot process startup profile")
+    parser.add_argument("--modules", default="silent_bot,echo_bot", help="comma separated bot modules")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per module; the median is reported")
+    parser.add_argument("--top", type=int, default=8, help="slowest modules to list")
+    parser.add_argument("--budget-ms", type=float, default=0.0, help="fail when a median import time is over this")
+    parser.add_argument("--json", default="", help="write results to this file as JSON")
+    args = parser.parse_args()
+
+    results = [profile(module, args.runs, args.top) for module in args.modules.split(",")]
+    over    = []
+    for r in results :
+        print(f"{r['module']}: {r['import_ms']:.1f} ms, {r['rss_mb']:.1f} MB RSS, {r['modules']} modules, heavy: {', '.join(r['heavy']) or '-'}")
+        for m in r["slowest"] :
+            print(f"    {m['self_ms']:8.2f} ms self {m['cumulative_ms']:8.2f} ms cumulative  {m['name']}")
+        if args.budget_ms and r["import_ms"] > args.budget_ms :
+            over.append(r["module"])
+
+    if args.json :
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if over :
+        print(f"over the {args.budget_ms:.0f} ms budget: {', '.join(over)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
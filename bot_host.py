@@ -0,0 +1,277 @@
+import importlib
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import traceback
+from   multiprocessing.connection import Connection
+
+
+BOT_CLASSES = {
+    "echo_bot"   : "EchoBot",
+    "silent_bot" : "SilentBot",
+}
+
+
+# ---------------------------------------------------------------------------
+# worker process side
+# ---------------------------------------------------------------------------
+
+def _run_room(bot_class, device_suffix, url, token, delay, rooms, lock, send, release) :
+    bot = None
+    try :
+        # daily's EventHandler.__new__ rejects keyword arguments
+        bot = bot_class(device_suffix)
+        bot.delay( int(delay)/1000.0 )
+        with lock :
+            rooms[url] = bot
+        print(f"bot_host {bot_class.__name__} {delay} msec. : {url} ")
+        bot.run(url, token)
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        traceback.print_exc()
+
+    finally:
+        if bot is not None :
+            bot._app_quit = True
+            try :
+                bot.leave()
+            except Exception as e:
+                print(f"An error occurred leaving {url}: {e}")
+        with lock :
+            rooms.pop(url, None)
+        release(device_suffix)
+        send({"event": "exited", "url": url})
+
+
+def serve(conn, max_rooms) :
+    """Worker main loop: one Daily.init() shared by every room it hosts."""
+    from daily import Daily
+    from gc_policy import policy as gc_policy
+
+    gc_policy.install()
+    Daily.init()
+    classes = { name : getattr(importlib.import_module(name), cls) for name, cls in BOT_CLASSES.items() }
+    gc_policy.after_startup()
+
+    rooms      = {}
+    threads    = []
+    lock       = threading.Lock()
+    send_lock  = threading.Lock()
+    # daily has no way to destroy virtual devices, so rooms reuse a fixed set of device names
+    suffixes   = [f"-{n}" for n in range(max_rooms)]
+
+    def release(suffix) :
+        with lock :
+            suffixes.append(suffix)
+
+    def send(message) :
+        with send_lock :
+            try :
+                conn.send(message)
+            except (OSError, EOFError) :
+                pass
+
+    send({"event": "ready"})
+
+    while True :
+        try :
+            message = conn.recv()
+        except (EOFError, OSError) :
+            break
+
+        cmd = message.get("cmd")
+        if cmd == "start" :
+            with lock :
+                busy   = not suffixes or message["url"] in rooms or message.get("bot_name") not in classes
+                suffix = None if busy else suffixes.pop()
+            if busy :
+                send({"event": "rejected", "url": message["url"]})
+                continue
+            thread = threading.Thread(target=_run_room, daemon=True, args=(
+                classes[message["bot_name"]], suffix,
+                message["url"], message["token"], message["delay"], rooms, lock, send, release))
+            thread.start()
+            threads = [t for t in threads if t.is_alive()] + [thread]
+        elif cmd == "stop" :
+            break
+
+    with lock :
+        for bot in rooms.values() :
+            bot._app_quit = True
+    for thread in threads :
+        thread.join(timeout=10)
+
+    Daily.deinit()
+    print(f"gc {gc_policy.summary()}")
+    print("bot_host exited.")
+
+
+# ---------------------------------------------------------------------------
+# server side
+# ---------------------------------------------------------------------------
+
+class BotHostWorker :
+    """One worker process, started as `python bot_host.py <max_rooms> <fd>`.
+
+    Running this module directly keeps the server's own imports and
+    module-level setup out of the worker; the pipe end is inherited as fd.
+    """
+
+    def __init__(self, max_rooms) :
+        self.max_rooms  = max_rooms
+        self.rooms      = {}        # url -> bot_name
+        self._lock      = threading.Lock()
+        self.ready      = threading.Event()
+        self.conn, child = multiprocessing.Pipe()
+        self.process    = subprocess.Popen([sys.executable, os.path.abspath(__file__), str(max_rooms), str(child.fileno())],
+                                           pass_fds=(child.fileno(),))
+        child.close()
+        self._reader    = threading.Thread(target=self._read_events, daemon=True)
+        self._reader.start()
+
+    @property
+    def pid(self) :
+        return self.process.pid
+
+    def alive(self) :
+        return self.process.poll() is None and not self.conn.closed
+
+    def load(self) :
+        with self._lock :
+            return len(self.rooms)
+
+    def has_capacity(self) :
+        return self.alive() and self.load() < self.max_rooms
+
+    def has_room(self, url) :
+        with self._lock :
+            return url in self.rooms
+
+    def start(self, bot_name, url, token, delay) :
+        with self._lock :
+            self.rooms[url] = bot_name
+        self.conn.send({"cmd": "start", "bot_name": bot_name, "url": url, "token": token, "delay": delay})
+
+    def stop(self, timeout=15) :
+        try :
+            self.conn.send({"cmd": "stop"})
+        except (OSError, EOFError) :
+            pass
+        try :
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired :
+            self.process.terminate()
+            self.process.wait()
+
+    def _read_events(self) :
+        while True :
+            try :
+                message = self.conn.recv()
+            except (EOFError, OSError) :
+                break
+            event = message.get("event")
+            if event == "ready" :
+                self.ready.set()
+            elif event in ("exited", "rejected") :
+                with self._lock :
+                    self.rooms.pop(message["url"], None)
+                print(f"bot_host {self.pid} {event} {message['url']}")
+        with self._lock :
+            self.rooms.clear()
+        self.conn.close()
+
+
+class BotHostPool :
+    """Dispatches rooms to long-lived worker processes hosting many bots each.
+
+    The pool keeps at least `workers` processes and, when `idle` > 0, that
+    many warm workers with no rooms, already past Daily.init() and waiting
+    for a room. Refills happen on a background thread after each dispatch.
+    """
+
+    def __init__(self, workers, rooms_per_worker, idle=0, max_workers=None) :
+        self.size             = workers
+        self.rooms_per_worker = rooms_per_worker
+        self.idle             = idle
+        self.max_workers      = max_workers or max(workers, 1) + idle
+        self.workers          = []
+        self._lock            = threading.Lock()
+        self._stopped         = False
+
+    def start(self) :
+        self._stopped = False
+        self._replenish()
+
+    def _spawn(self) :
+        worker = BotHostWorker(self.rooms_per_worker)
+        self.workers.append(worker)
+        return worker
+
+    def _idle_workers(self) :
+        return [w for w in self.workers if w.alive() and w.load() == 0]
+
+    def _replenish(self) :
+        with self._lock :
+            if self._stopped :
+                return
+            self.workers = [w for w in self.workers if w.alive()]
+            while len(self.workers) < self.max_workers and \
+                  (len(self.workers) < self.size or len(self._idle_workers()) < self.idle) :
+                self._spawn()
+
+            surplus = len(self._idle_workers()) - self.idle
+            retired = []
+            for worker in self._idle_workers() :
+                if surplus <= 0 or len(self.workers) <= self.size :
+                    break
+                self.workers.remove(worker)
+                retired.append(worker)
+                surplus -= 1
+        for worker in retired :
+            worker.stop()
+
+    def room_count(self, url) :
+        return sum(1 for worker in self.workers if worker.has_room(url))
+
+    def rooms(self) :
+        return sum(worker.load() for worker in self.workers)
+
+    def pids(self, hosting=False) :
+        # hosting=True leaves out warm workers with no rooms yet
+        return [worker.pid for worker in self.workers if worker.alive() and (not hosting or worker.load() > 0)]
+
+    def dispatch(self, bot_name, url, token, delay) :
+        with self._lock :
+            self.workers = [w for w in self.workers if w.alive()]
+            candidates   = [w for w in self.workers if w.has_capacity()]
+            warm         = [w for w in candidates if w.ready.is_set()]
+            if warm :
+                worker = min(warm, key=lambda w : w.load())
+            elif candidates :
+                worker = min(candidates, key=lambda w : w.load())
+            elif len(self.workers) < self.max_workers :
+                worker = self._spawn()      # cold start; the pipe buffers the request until it is ready
+            else :
+                raise RuntimeError(f"All {len(self.workers)} bot hosts are full")
+            worker.start(bot_name, url, token, delay)
+
+        threading.Thread(target=self._replenish, daemon=True).start()
+        return worker.pid
+
+    def stop(self) :
+        with self._lock :
+            self._stopped = True
+            workers, self.workers = self.workers, []
+        threads = [threading.Thread(target=w.stop) for w in workers]
+        for thread in threads :
+            thread.start()
+        for thread in threads :
+            thread.join()
+
+
+if __name__ == "__main__":
+    # started by BotHostWorker with the worker's pipe end as an inherited fd
+    serve(Connection(int(sys.argv[2])), int(sys.argv[1]))
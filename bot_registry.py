@@ -0,0 +1,135 @@
+import asyncio
+import json
+import os
+
+
+BOT_REGISTRY        = os.getenv("BOT_REGISTRY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "bots.json"))
+BOT_REGISTRY_RELOAD = float(os.getenv("BOT_REGISTRY_RELOAD", "0"))     # seconds between config checks, 0 = never
+BIRDCONV_BATCH      = int(os.getenv("BIRDCONV_BATCH", "50"))           # bots per registration request
+
+
+class BotEntry :
+
+    def __init__(self, path, bot, delay) :
+        self.path  = path
+        self.bot   = bot
+        self.delay = str(delay)
+
+    def __eq__(self, other) :
+        return isinstance(other, BotEntry) and (self.path, self.bot, self.delay) == (other.path, other.bot, other.delay)
+
+    def __repr__(self) :
+        return f"BotEntry({self.path!r}, {self.bot!r}, {self.delay!r})"
+
+
+def load_entries(source, known=None) :
+    """Entries from a JSON file path, or from inline JSON if `source` starts with '['.
+
+    Each entry is {"bot": module, "delay": msec} with an optional "path",
+    which defaults to "<bot>_<delay>".
+    """
+    if source.lstrip().startswith("[") :
+        config = json.loads(source)
+    else :
+        with open(source) as f:
+            config = json.load(f)
+
+    entries = {}
+    for item in config:
+        bot   = item["bot"]
+        delay = str(item.get("delay", "0"))
+        path  = item.get("path") or f"{bot}_{delay}"
+        if known is not None and bot not in known:
+            raise ValueError(f"Unknown bot module {bot} for /{path}")
+        if path in entries:
+            raise ValueError(f"Duplicate bot path /{path}")
+        entries[path] = BotEntry(path, bot, delay)
+    return entries
+
+
+class BotRegistry :
+    """Bot endpoints served by this host, and their registration with birdconv.
+
+    register() only posts entries whose availability differs from what
+    birdconv last accepted, split into batches of `batch` bots posted
+    concurrently. Entries dropped from the config by reload() are posted
+    once more as unavailable.
+    """
+
+    def __init__(self, source=BOT_REGISTRY, known=None, batch=BIRDCONV_BATCH) :
+        self.source      = source
+        self.known       = known
+        self.batch       = batch
+        self.entries     = load_entries(source, known)
+        self.registered  = {}       # path -> availability birdconv last accepted
+        self._removed    = set()
+        self._mtime      = self._source_mtime()
+        self._lock       = asyncio.Lock()
+
+    def __len__(self) :
+        return len(self.entries)
+
+    def get(self, path) :
+        return self.entries.get(path)
+
+    def _source_mtime(self) :
+        try:
+            return os.stat(self.source).st_mtime
+        except (OSError, ValueError):
+            return None
+
+    def reload(self) :
+        # returns whether the config changed; a broken config keeps the current entries
+        mtime = self._source_mtime()
+        if mtime is None or mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            entries = load_entries(self.source, self.known)
+        except Exception as e:
+            print(f"Unable to reload bot registry {self.source}: {e}")
+            return False
+        self._removed |= set(self.entries) - set(entries)
+        self._removed -= set(entries)
+        for path, entry in entries.items():
+            if path in self.entries and self.entries[path] != entry:
+                self.registered.pop(path, None)
+        self.entries = entries
+        print(f"Bot registry reloaded: {len(entries)} bots, {len(self._removed)} to unregister")
+        return True
+
+    async def register(self, session, url, uid, service_host, available) :
+        async with self._lock:
+            updates = {}
+            for path in self.entries:
+                if self.registered.get(path) != available:
+                    updates[path] = available
+            for path in self._removed:
+                updates[path] = False
+            if not updates:
+                return
+
+            paths   = list(updates)
+            batches = [paths[i:i + self.batch] for i in range(0, len(paths), self.batch)]
+
+            async def post(batch) :
+                payload = { "bots": {
+                    path: {"uid": uid, "service": f"{service_host}/{path}", "available": updates[path]}
+                    for path in batch } }
+                try:
+                    async with session.post(url, json=payload) as response:
+                        if response.status != 200:
+                            print(f"Failed to register {len(batch)} bots: {response.status}")
+                            return
+                except Exception as e:
+                    print(f"Error registering bots: {e}")
+                    return
+                for path in batch:
+                    if path in self._removed:
+                        self._removed.discard(path)
+                        self.registered.pop(path, None)
+                    else:
+                        self.registered[path] = updates[path]
+
+            await asyncio.gather(*(post(batch) for batch in batches))
+            print(f"Bots {'registered' if available else 'unregistered'}: {sum(self.registered.get(p) == available for p in self.entries)}/{len(self.entries)}")
@@ -1,143 +1,585 @@
+import os
 import time
 import threading
 import json
-from typing import Mapping
-from   daily import *
+from   daily import Daily, CallClient, EventHandler
 from   runner import configure
-import cv2
-from PIL import Image
-import struct
-import numpy as np
 import queue
-import gc
+import collections
+from   ring_buffer import RingBuffer, PcmRingBuffer
+from   silence import silent_audio, silent_audio_for
+from   video_transform import VideoTransform, load_cv2
+from   video_quality import VideoQuality
+from   gc_policy import policy as gc_policy
+from   metrics import StreamMetrics, MetricsReporter
+
+
+ASSUMED_LATENCY   = 0.150
+AUDIO_CHUNK_RATE  = 100     # 10ms AudioData chunks per second
+VIDEO_FRAME_RATE  = 30
+AUDIO_BUFFER_MODE = os.getenv("AUDIO_BUFFER_MODE", "pcm")   # "pcm" or "frames"
+VIDEO_CONVERT_MODE = os.getenv("VIDEO_CONVERT_MODE", "lazy") # "lazy" or "ingest"
+MEDIA_CLOCK_MODE   = os.getenv("MEDIA_CLOCK", "media")        # "media" or "wall"
+MEDIA_CLOCK_RESYNC = float(os.getenv("MEDIA_CLOCK_RESYNC", "0.5"))
+AV_SYNC_MODE       = os.getenv("AV_SYNC", "audio")            # "audio" or "off"
+VIDEO_MAX_QUALITY  = os.getenv("VIDEO_MAX_QUALITY", "medium")  # simulcast layer to receive; "" for Daily's default
+VIDEO_BUFFER_MAX_MB = float(os.getenv("VIDEO_BUFFER_MAX_MB", "192"))
+AUDIO_BUFFER_MAX_MB = float(os.getenv("AUDIO_BUFFER_MAX_MB", "16"))
+VIDEO_EVICTION     = os.getenv("VIDEO_EVICTION", "decimate")   # "decimate" or "oldest"
+BUFFER_SLACK       = 1.0     # seconds held beyond the maximum delay
+AUDIO_WRITE_MS     = int(os.getenv("AUDIO_WRITE_MS", "20"))    # microphone write size; 10 writes each chunk as it arrives
+AUDIO_JITTER_MS    = int(os.getenv("AUDIO_JITTER_MS", "40"))   # audio held before playback starts
+DELAY_TOLERANCE    = float(os.getenv("DELAY_TOLERANCE", "0.08")) # achieved delay drift, in seconds, before the cursor seeks again
+
+
+class MediaClock :
+    """One monotonic reference shared by all streams of a bot.
+
+    In "media" mode a stream's frame times come from the media itself
+    (sample counts for audio, timestamp_us for video) and only follow
+    arrival time when they drift from it by more than `resync` seconds,
+    e.g. after a mute or a sender restart. In "wall" mode every frame is
+    stamped with its arrival time.
+    """
+
+    def __init__(self, mode=MEDIA_CLOCK_MODE, resync=MEDIA_CLOCK_RESYNC) :
+        self.mode      = mode
+        self.resync    = resync
+        self.reference = time.monotonic()
+
+    def now(self) :
+        return time.monotonic() - self.reference
+
+    def audio(self) :
+        return AudioClock(self)
+
+    def video(self) :
+        return VideoClock(self)
+
+
+class StreamClock :
+
+    def __init__(self, clock) :
+        self.clock    = clock
+        self.resyncs  = 0
+        self._origin  = None    # reference time of position _base
+        self._base    = 0
+        self._scale   = 0.0     # seconds per position unit
+        self._last    = 0.0
+
+    def stamp(self, position, scale) :
+        # never step back behind frames already stamped; the ring bisects on these times
+        arrival = max( self.clock.now(), self._last )
+        if self.clock.mode == "media" and position is not None :
+            if self._origin is not None and scale == self._scale :
+                media_time = self._origin + (position - self._base) * scale
+                if abs(media_time - arrival) <= self.clock.resync and media_time >= self._last :
+                    self._last = media_time
+                    return media_time
+                self.resyncs += 1
+            self._origin = arrival
+            self._base   = position
+            self._scale  = scale
+        self._last = arrival
+        return arrival
+
+
+class AudioClock(StreamClock) :
+
+    def __init__(self, clock) :
+        super().__init__(clock)
+        self._samples = 0
+
+    def stamp_audio(self, data) :
+        position       = self._samples
+        self._samples += data.num_audio_frames
+        return self.stamp( position, 1.0 / data.sample_rate )
+
+
+class VideoClock(StreamClock) :
+
+    def stamp_video(self, data) :
+        # frames without a capture timestamp fall back to arrival time
+        return self.stamp( data.timestamp_us or None, 1e-6 )
+
+
+class PlayoutClock :
+    """Audio-mastered playout position shared by a bot's writers.
+
+    The audio writer reports the media time of every chunk it writes; the
+    video writer asks for the current position, extrapolated from the last
+    chunk, and shows the frame that was on screen at that media time.
+    """
+
+    def __init__(self, clock) :
+        self.clock       = clock
+        self._audio_time = None     # media time of the last audio chunk written
+        self._audio_at   = 0.0      # reference time it was written
+
+    def audio_written(self, data) :
+        self.audio_written_at( data.elapsed_time )
+
+    def audio_written_at(self, media_time) :
+        self._audio_time = media_time
+        self._audio_at   = self.clock.now()
 
+    def position(self) :
+        if self._audio_time is None :
+            return None
+        return self._audio_time + ( self.clock.now() - self._audio_at )
+
+
+class DropOldest :
+    """Evicts the oldest entries until the buffer is back under its byte cap."""
+
+    def admit(self, media, timestamp, size) :
+        return True
+
+    def evict(self, media) :
+        buffer = media.buffer
+        while len(buffer) > 1 and buffer.nbytes > media.max_bytes :
+            buffer.popleft()
+            media.metrics.evictions += 1
+
+
+class Decimate(DropOldest) :
+    """Lowers the admitted frame rate so the byte cap covers the requested delay.
+
+    A frame is admitted once `span * size / max_bytes` seconds have passed
+    since the last admitted one, which spaces kept frames evenly across the
+    span. Frames in between are stored as references to the last admitted
+    frame, so readers see it held for longer. Anything still over the cap
+    drops the oldest.
+    """
+
+    def __init__(self) :
+        self._admitted = None      # timestamp of the last admitted frame
+
+    def admit(self, media, timestamp, size) :
+        if not media.max_bytes or len(media.buffer) == 0 :
+            self._admitted = timestamp
+            return True
+        span     = min( media.max_duration, media._delay + BUFFER_SLACK )
+        interval = span * size / media.max_bytes
+        if self._admitted is None or timestamp < self._admitted or timestamp - self._admitted >= interval * 0.95 :
+            self._admitted = timestamp
+            return True
+        return False
+
+
+EVICTION_POLICIES = {
+    "oldest"   : DropOldest,
+    "decimate" : Decimate,
+}
 
-ASSUMED_LATENCY = 0.150
 
 class MediaBuffer : 
 
-    def __init__(self, max_delay,maxsize=1) :
-        self.buffer       = []
+    def __init__(self, max_delay,maxsize=1,rate=VIDEO_FRAME_RATE,clock=None,max_bytes=0,eviction="oldest") :
+        self.buffer       = RingBuffer.for_stream(max_delay, rate, BUFFER_SLACK)
+        self.clock        = clock
+        self.max_duration = max_delay + BUFFER_SLACK
+        self.max_bytes    = max_bytes        # 0 = bounded by duration only
+        self.eviction     = EVICTION_POLICIES[eviction]()
         self._delay       = 0.0
-        self.read_index   = -1
+        self._cursor      = -1      # sequence number of the last frame read
+        self._read_seq    = -1      # newest sequence number when the cursor last moved
+        self._seek        = True
         self.max_delay    = max_delay
+        self.interval     = 1.0 / rate
         self.frame_queue = queue.Queue(maxsize=maxsize)
+        self.metrics      = StreamMetrics()
         # self.lastTime     = time.time()
 
     def pop(self) :
 
-        dt = self.buffer[-1].elapsed_time - self.buffer[0].elapsed_time
+        newest = self.buffer.time(-1)
+        dt     = newest - self.buffer.time(0)
 
-        if dt  >= self._delay :
+        if self._delay > 0.0 and dt >= self._delay :
 
-            actual_delay = self.buffer[-1].elapsed_time - self.buffer[ self.read_index ].elapsed_time 
+            # stamps land on the target grid, so allow half a frame for float rounding
+            target = newest - self._delay + self.interval / 2
 
-            if ( abs( actual_delay - self._delay) > 0.25 ) :
-                self.read_index = self._find_index()
+            if not self._seek and self._cursor >= self.buffer.first_seq :
+                # one entry read per entry appended, so arrival jitter cannot repeat or skip one
+                self._cursor = min( self._cursor + self.buffer.last_seq - self._read_seq, self.buffer.last_seq )
+                drift        = newest - self.buffer.time_at_seq( self._cursor ) - self._delay
+                self._seek   = abs(drift) > DELAY_TOLERANCE
 
-            if (dt > self.max_delay + 1.0) :
-                self.buffer.pop(0)
+            if self._seek or self._cursor < self.buffer.first_seq :
+                self._cursor = self.buffer.first_seq + self.buffer.search(target)
+                self._seek   = False
+            self._read_seq = self.buffer.last_seq
 
-            return self.buffer[ self.read_index ]
+            self.metrics.delay = newest - self.buffer.time_at_seq( self._cursor )
+            return self.buffer.at_seq( self._cursor )
         else :
+            self._cursor = self.buffer.last_seq
+            self._seek   = True      # the span shrank below the delay; find the target again once it refills
+            self.metrics.delay = 0.0
             return self.buffer[-1]
-    
-    
-    def _find_index(self) :
 
-        if ( self._delay <= 0.0 ) :
-            return -1
-            
-        index = self.read_index
-        
-        while ( abs(index) < len(self.buffer) and index < 0) :
-            dt_p = (self.buffer[-1].elapsed_time - self.buffer[index    ].elapsed_time) - self._delay 
-            dt_m = (self.buffer[-1].elapsed_time - self.buffer[index - 1].elapsed_time) - self._delay
-            if ( dt_p * dt_m < 0.0 ) :
-                if ( abs(dt_p) < abs(dt_m) ) :
-                    return index
-                else :
-                    return index - 1
-            if   ( dt_p < 0.0  and dt_m < 0.0 ) :
-                index -= 1
-            elif ( dt_p > 0.0 and dt_m > 0.0 ) :
-                index += 1
-            elif ( dt_p == 0.0 ) :
-                return index
-            else :   # dt_m == 0.0
-                return index - 1
-
-        return index
+    def store(self, item, timestamp, size=0) :
+        # caps are enforced here, on the media thread, so a stalled reader cannot grow the buffer
+        if self.buffer.full() and timestamp - self.buffer.time(0) <= self.max_duration :
+            # a sender faster than the nominal rate; the duration and byte caps bound the ring, not its length
+            self.buffer.grow()
+        if self.eviction.admit( self, timestamp, size ) :
+            self.buffer.append( item, timestamp, size )
+        else :
+            self.buffer.append( self.buffer[-1], timestamp, 0 )
+            self.metrics.evictions += 1
+        while len(self.buffer) > 1 and timestamp - self.buffer.time(0) > self.max_duration :
+            self.buffer.popleft()
+            self.metrics.evictions += 1
+        if self.max_bytes and self.buffer.nbytes > self.max_bytes :
+            self.eviction.evict(self)
+
+    def buffer_bytes(self) :
+        return self.buffer.nbytes
 
     def delay(self, value):
         self._delay = max(0, value - ASSUMED_LATENCY ) # 150ms latency
+        self._seek  = True
 
     def addToQueue(self) :
+        self.metrics.frames_in += 1
         try:
             self.frame_queue.put( self.pop(), block=False )
         except queue.Full:
-            pass
+            self.metrics.drops += 1
 
-    def getFromQueue(self) :
+    def getFromQueue(self, timeout=0.0) :
+        # with a timeout, block until append() queues a frame or the timeout elapses
         try :
             # lastTime = self.lastTime
-            data = self.frame_queue.get(block=False)
+            data = self.frame_queue.get(block=timeout > 0.0, timeout=timeout if timeout > 0.0 else None)
             # self.lastTime = time.time()
             # if ( self.lastTime - lastTime > 1.0) :
             #     timing = time.time() - data.elapsed_time    
-            #     print(f"{self.__class__.__name__} delay is {timing:.2f} seconds. {self.read_index} {len(self.buffer)} {(self.lastTime - lastTime):.2f} {(1.0/(self.lastTime - lastTime)):.2f}")
+            #     print(f"{self.__class__.__name__} delay is {timing:.2f} seconds. {self._cursor} {len(self.buffer)} {(self.lastTime - lastTime):.2f} {(1.0/(self.lastTime - lastTime)):.2f}")
             return data
         except queue.Empty:
             return None
         
 class AudioBuffer(MediaBuffer) :
 
-    def __init__(self, max_delay=5.0,maxsize=1) :
-        super().__init__(max_delay,maxsize=maxsize)
+    def __init__(self, max_delay=5.0,maxsize=1,rate=AUDIO_CHUNK_RATE,clock=None,max_bytes=AUDIO_BUFFER_MAX_MB * 2**20) :
+        super().__init__(max_delay,maxsize=maxsize,rate=rate,clock=clock or MediaClock().audio(),max_bytes=max_bytes)
 
     def append(self, data ) :
-        self.buffer.append( BufferedAudioData( data , silent = (self._delay <= 0.0) ))
+        buffered_audio_data = BufferedAudioData( data , self.clock.stamp_audio(data), silent = (self._delay <= 0.0) )
+        self.store( buffered_audio_data, buffered_audio_data.elapsed_time, buffered_audio_data.nbytes() )
         self.addToQueue()
 
-class VideoBuffer(MediaBuffer) : 
+class PcmAudioBuffer(MediaBuffer) :
 
-    def __init__(self, camera, max_delay=5.0,maxsize=1) :
-        super().__init__(max_delay,maxsize=maxsize)
-        self._camera = camera
+    def __init__(self, max_delay=5.0,maxsize=1,rate=AUDIO_CHUNK_RATE,sample_rate=48000,channels=1,clock=None) :
+        super().__init__(max_delay,maxsize=maxsize,rate=rate,clock=clock or MediaClock().audio())
+        self.pcm = PcmRingBuffer(max_delay, sample_rate=sample_rate, channels=channels)
 
     def append(self, data ) :
-        self.buffer.append( BufferedVideoData( data, self._camera.width, self._camera.height ) )
+        if data.sample_rate != self.pcm.sample_rate or data.num_channels != self.pcm.channels :
+            self.pcm = PcmRingBuffer(self.max_delay, sample_rate=data.sample_rate, channels=data.num_channels)
+            self.buffer.clear()
+        samples = data.num_audio_frames * data.num_channels
+        start   = self.pcm.write( data.audio_frames )
+        # samples live in the preallocated PCM ring, so only the duration cap applies here
+        self.store( (start, samples), self.clock.stamp_audio(data) )
         self.addToQueue()
 
+    def buffer_bytes(self) :
+        return (self.pcm.written - self.pcm.oldest) * 2
+
+    def pop(self) :
+        start, samples = super().pop()
+        return PcmChunk( self.pcm, start, samples, elapsed_time=self.buffer.time_at_seq(self._cursor), silent=(self._delay <= 0.0) )
+
+class VideoBuffer(MediaBuffer) : 
+
+    def __init__(self, camera, max_delay=5.0,maxsize=1,rate=VIDEO_FRAME_RATE,convert=VIDEO_CONVERT_MODE,clock=None,playout=None,
+                 max_bytes=VIDEO_BUFFER_MAX_MB * 2**20,eviction=VIDEO_EVICTION) :
+        super().__init__(max_delay,maxsize=maxsize,rate=rate,clock=clock or MediaClock().video(),max_bytes=max_bytes,eviction=eviction)
+        self._camera    = camera
+        self._transform = VideoTransform(camera.width, camera.height, camera.color_format)
+        self._convert   = convert
+        self.playout    = playout   # when set, run_playout() picks frames instead of the queue
+        self._lock      = threading.Lock()
+        self.quality    = VideoQuality(self)
+
+    def set_quality(self, fps, interpolation) :
+        self.interval                 = 1.0 / fps
+        self._transform.interpolation = interpolation
+
+    def append(self, data ) :
+        buffered_video_data = BufferedVideoData( data, self.clock.stamp_video(data), self._transform, self._converted )
+        if self._convert == "ingest" :
+            buffered_video_data.frames()
+        # frame_at() and _converted() touch the ring from the writer thread
+        with self._lock :
+            buffered_video_data.seq = self.buffer.last_seq + 1
+            self.store( buffered_video_data, buffered_video_data.elapsed_time, buffered_video_data.nbytes() )
+        if self.playout is None :
+            self.addToQueue()
+        else :
+            self.metrics.frames_in += 1
+
+    def _converted(self, buffered_video_data, size) :
+        # a converted frame holds the camera's bytes rather than its source's
+        with self._lock :
+            self.buffer.resize( buffered_video_data.seq, size, buffered_video_data )
+
+    def frame_at(self, position) :
+        with self._lock :
+            return self._frame_at(position)
+
+    def _frame_at(self, position) :
+        # the frame on screen at media time `position`; without audio, follow our own delay
+        if len(self.buffer) == 0 :
+            return None
+        newest = self.buffer.time(-1)
+        if position is None :
+            position = newest - self._delay
+
+        previous = self._cursor
+        if self._seek or self._cursor < self.buffer.first_seq or position < self.buffer.time_at_seq(self._cursor) :
+            self._cursor = self.buffer.first_seq + self.buffer.search(position)
+            self._seek   = False
+        else :
+            while self._cursor < self.buffer.last_seq and self.buffer.time_at_seq(self._cursor + 1) <= position :
+                self._cursor += 1
+
+        frame_time = self.buffer.time_at_seq( self._cursor )
+        self.metrics.delay = newest - frame_time
+        self.metrics.skew  = position - frame_time
+        if self._cursor == previous :
+            self.metrics.duplicates += 1
+        elif previous >= self.buffer.first_seq and self._cursor > previous + 1 :
+            self.metrics.drops += self._cursor - previous - 1
+        return self.buffer.at_seq( self._cursor )
+
 class BufferedAudioData :
-    def __init__(self, data, silent=False) :
+    def __init__(self, data, elapsed_time, silent=False) :
         self.data             = data
-        self.elapsed_time     = time.time()
+        self.elapsed_time     = elapsed_time
         self.silent           = silent
 
+    def nbytes(self) :
+        return self.data.num_audio_frames * self.data.num_channels * self.data.bits_per_sample // 8
+
     def frames(self, silent=False) :
         if self.silent or silent :
-            return bytes([0] * int(self.data.num_audio_frames * self.data.num_channels * self.data.bits_per_sample / 8) )
+            return silent_audio_for(self.data)
         else :  
             return self.data.audio_frames
         
 
+class PcmChunk :
+    __slots__ = ("pcm", "start", "samples", "elapsed_time", "silent")
+
+    def __init__(self, pcm, start, samples, elapsed_time, silent=False) :
+        self.pcm          = pcm
+        self.start        = start
+        self.samples      = samples
+        self.elapsed_time = elapsed_time
+        self.silent       = silent
+
+    def frames(self, silent=False) :
+        if self.silent or silent :
+            return silent_audio(self.samples)
+        return self.pcm.read( self.start, self.samples )
+
+
 class BufferedVideoData :
-    def __init__(self, data, expected_width, expected_height) :
+    def __init__(self, data, elapsed_time, transform, on_convert=None) :
         self.data            = data
-        self.elapsed_time    = time.time() #data.timestamp_us/1000000.0
-        # self.expected_width  = expected_height
-        # self.expected_height = expected_width
+        self.elapsed_time    = elapsed_time
+        self.transform       = transform
+        self.on_convert      = on_convert
+        self.seq             = -1
+        self._frames         = None
 
-        self.expected_width  = expected_width
-        self.expected_height = expected_height
+    def nbytes(self) :
+        frames = self._frames
+        return len(frames) if frames is not None else len(self.data.buffer)
 
     def frames(self, silent=False) :
-        image = Image.frombytes(self.data.color_format, (self.data.width, self.data.height), self.data.buffer)
-        if image.width != self.expected_width or image.height != self.expected_height:
-            image = image.resize((self.expected_width, self.expected_height), Image.LANCZOS)  # LANCZOS for high-quality resizing
-        return image.tobytes()
-        # return image.transpose(Image.ROTATE_270).tobytes()
+        # convert at most once; the ring drops the result when it evicts this frame
+        if self._frames is None :
+            self._frames = self.transform.apply(self.data)
+            self.data    = None
+            if self.on_convert is not None :
+                self.on_convert( self, len(self._frames) )
+        return self._frames
+
+
+def timed_write(metrics, data, write) :
+    start     = time.perf_counter()
+    frames    = data.frames()
+    converted = time.perf_counter()
+    write( frames )
+    written   = time.perf_counter()
+    metrics.convert.observe( converted - start )
+    metrics.write.observe( written - converted )
+    metrics.frames_out += 1
+    return written - start
+
+
+def run_writer(buffer, write, should_quit, on_idle=None, on_write=None, quality=None) :
+    # block on the buffer's queue for at most one frame interval, then write what arrived
+    while not should_quit() :
+        data = buffer.getFromQueue( timeout=buffer.interval )
+        if data :
+            if quality is not None and not quality.due() :
+                buffer.metrics.drops += 1
+            else :
+                busy = timed_write( buffer.metrics, data, write )
+                if quality is not None :
+                    quality.observe( busy )
+                if on_write is not None :
+                    on_write( data )
+        if on_idle is not None :
+            on_idle()
+
+
+def run_playout(buffer, write, should_quit, on_idle=None) :
+    # write the frame matching the audio position once per frame interval. When a write
+    # overruns, skip ahead instead of catching up, and don't spend time re-writing duplicates.
+    next_tick = time.monotonic()
+    behind    = False
+    quality   = buffer.quality
+    while not should_quit() :
+        previous = buffer._cursor
+        data     = buffer.frame_at( buffer.playout.position() )
+        if data is not None and (buffer._cursor != previous or (quality.rewrite_duplicates and not behind)) :
+            quality.observe( timed_write( buffer.metrics, data, write ) )
+        if on_idle is not None :
+            on_idle()
+        next_tick += buffer.interval
+        wait       = next_tick - time.monotonic()
+        behind     = wait < 0.0
+        if behind :
+            next_tick = time.monotonic()
+        else :
+            time.sleep( wait )
+
+
+def camera_subscription() :
+    # a 720x1280 portrait sender's medium simulcast layer is the camera's 360x640
+    if not VIDEO_MAX_QUALITY :
+        return "subscribed"
+    return { "subscriptionState": "subscribed", "settings": { "maxQuality": VIDEO_MAX_QUALITY } }
+
+
+class AudioJitterBuffer :
+    """Coalesces 10 ms chunks into fixed-size microphone writes.
+
+    Playback starts once `target_ms` of audio is held. A write that finds
+    less than `write_ms` is padded with silence and counted as an underrun;
+    when the buffer runs dry it re-primes, writing silence until the target
+    is held again. Audio piling up beyond twice the target plus one write
+    is trimmed back to the target from the oldest end and counted as an
+    overrun.
+    """
+
+    def __init__(self, metrics, sample_rate=48000, channels=1, write_ms=AUDIO_WRITE_MS, target_ms=AUDIO_JITTER_MS) :
+        self.metrics      = metrics
+        self.sample_rate  = sample_rate
+        self.channels     = channels
+        self.frame_bytes  = 2 * channels
+        bytes_per_ms      = sample_rate * self.frame_bytes // 1000
+        self.write_bytes  = write_ms * bytes_per_ms
+        self.target_bytes = max(target_ms * bytes_per_ms, self.write_bytes)
+        self.limit_bytes  = 2 * self.target_bytes + self.write_bytes
+        self.period       = write_ms / 1000.0
+        self.latency      = self.target_bytes / (bytes_per_ms * 1000.0)
+        self.primed       = False
+        self._pcm         = bytearray()
+        self._times       = collections.deque()   # (bytes, media time of the chunk's first sample)
+
+    def __len__(self) :
+        return len(self._pcm)
+
+    def push(self, frames, media_time) :
+        if not frames :
+            return
+        self._pcm   += frames
+        self._times.append( [len(frames), media_time] )
+        if len(self._pcm) > self.limit_bytes :
+            self._consume( len(self._pcm) - self.target_bytes )
+            self.metrics.overruns += 1
+
+    def take(self) :
+        # (bytes for one write, media time of its first sample or None for pure silence)
+        if not self.primed :
+            if len(self._pcm) < self.target_bytes :
+                return silent_audio( self.write_bytes // self.frame_bytes, self.channels ), None
+            self.primed = True
+
+        media_time = self._times[0][1] if self._times else None
+        count      = min( len(self._pcm), self.write_bytes )
+        frames     = bytes( self._pcm[:count] )
+        self._consume( count )
+        if count < self.write_bytes :
+            self.metrics.underruns += 1
+            frames     += silent_audio( (self.write_bytes - count) // self.frame_bytes, self.channels )
+            self.primed = False
+        return frames, media_time
+
+    def _consume(self, count) :
+        del self._pcm[:count]
+        while count > 0 and self._times :
+            head = self._times[0]
+            if head[0] <= count :
+                count -= head[0]
+                self._times.popleft()
+            else :
+                head[0] -= count
+                head[1] += count / self.frame_bytes / self.sample_rate
+                count    = 0
+
+
+def run_audio_output(buffer, jitter, write, should_quit, on_write=None) :
+    # write one jitter-buffer period at a time, keeping one period queued ahead in the device
+    start   = time.monotonic()
+    written = 0.0        # seconds of audio written since start
+    while not should_quit() :
+        data = buffer.getFromQueue()
+        while data :
+            converted = time.perf_counter()
+            jitter.push( data.frames(), data.elapsed_time )
+            buffer.metrics.convert.observe( time.perf_counter() - converted )
+            buffer.metrics.frames_out += 1
+            data = buffer.getFromQueue()
+
+        frames, media_time = jitter.take()
+        started = time.perf_counter()
+        write( frames )
+        buffer.metrics.write.observe( time.perf_counter() - started )
+        if on_write is not None and media_time is not None :
+            on_write( media_time )
+
+        written += jitter.period
+        wait     = start + written - jitter.period - time.monotonic()
+        if wait > 0.0 :
+            time.sleep( wait )
+        elif wait < -jitter.period :
+            # we stalled long enough for the device to drain; restart the clock rather than burst
+            start, written = time.monotonic(), 0.0
+
+
+_speaker_device = None
+_speaker_lock   = threading.Lock()
+
+def speaker_device() :
+    # the speaker is process-wide; bots sharing a process share one device
+    global _speaker_device
+    with _speaker_lock :
+        if _speaker_device is None :
+            _speaker_device = Daily.create_speaker_device( "speaker",sample_rate=48000,channels=1)
+            Daily.select_speaker_device("speaker")
+        return _speaker_device
 
 
 class EchoBot(EventHandler):
@@ -202,7 +644,8 @@ class EchoBot(EventHandler):
 
     def delay(self, value):
         self._delay            = value
-        self._audio_buffer.delay( self._delay )
+        # the jitter buffer holds audio back too, so read that much less from the delay buffer
+        self._audio_buffer.delay( self._delay - (self._audio_output.latency if self._audio_output is not None else 0.0) )
         self._video_buffer.delay( self._delay )
 
     def send_ui(self, participant=None):
@@ -232,66 +675,96 @@ class EchoBot(EventHandler):
                 print(f"Connected to " + participant["info"]["userName"]  + " " + participant["id"] ) 
                 self._subscribed = True
                 self._client.set_audio_renderer(participant["id"], self.on_audio_frame )
-                self._client.set_video_renderer(participant["id"], self.on_video_frame )
+                # ask for the camera's color format so matching frames pass through unconverted
+                self._client.set_video_renderer(participant["id"], self.on_video_frame, color_format=self._camera.color_format )
 
         except Exception as e:
             print(f"An error occurred: {e}")
             self._app_quit = True
 
-    def __init__(self):
+    def __init__(self, device_suffix=""):
 
         self._app_quit    = False
         self._subscribed  = False
         self._function_map = {"delay" : self.delay}
         self._max_delay    = 5.0
 
-        self._speaker_device = Daily.create_speaker_device( "speaker",sample_rate=48000,channels=1)
-        Daily.select_speaker_device("speaker")
+        self._speaker_device = speaker_device()
 
-        self._microphone   = Daily.create_microphone_device("mic", sample_rate=48000 , channels=1 , non_blocking=True)
-        self._camera       = Daily.create_camera_device("cam", width=360, height=640, color_format="RGBA")
-        self._audio_buffer = AudioBuffer( self._max_delay, maxsize=15)
-        self._video_buffer = VideoBuffer(self._camera , self._max_delay)
+        self._microphone   = Daily.create_microphone_device(f"mic{device_suffix}", sample_rate=48000 , channels=1 , non_blocking=True)
+        self._camera       = Daily.create_camera_device(f"cam{device_suffix}", width=360, height=640, color_format="RGBA")
+        self._clock        = MediaClock()
+        self._playout      = PlayoutClock(self._clock) if AV_SYNC_MODE == "audio" else None
+        if AUDIO_BUFFER_MODE == "pcm" :
+            self._audio_buffer = PcmAudioBuffer( self._max_delay, maxsize=15, sample_rate=48000, channels=1, clock=self._clock.audio())
+        else :
+            self._audio_buffer = AudioBuffer( self._max_delay, maxsize=15, clock=self._clock.audio())
+        self._video_buffer = VideoBuffer(self._camera , self._max_delay, clock=self._clock.video(), playout=self._playout)
+        self._audio_output = None
+        if AUDIO_WRITE_MS > 10 :
+            self._audio_output = AudioJitterBuffer( self._audio_buffer.metrics, sample_rate=48000, channels=1 )
         self.delay(self._max_delay)
 
         self._client = CallClient(self)
-        self._client.update_subscription_profiles({ "base": {"camera": "subscribed", "microphone": "subscribed"}})
+        self._client.update_subscription_profiles({ "base": {"camera": camera_subscription(), "microphone": "subscribed"}})
         self._client.update_inputs({
-            "camera"    : { "isEnabled": True, "settings": {"deviceId": "cam" } },
-            "microphone": { "isEnabled": True, "settings": {"deviceId": "mic" } }
+            "camera"    : { "isEnabled": True, "settings": {"deviceId": f"cam{device_suffix}" } },
+            "microphone": { "isEnabled": True, "settings": {"deviceId": f"mic{device_suffix}" } }
         })
 
+        self._url              = None
+        self._metrics_reporter = MetricsReporter(self.metrics)
+
         self._init_time  = int(time.time())
+        def video_should_quit():
+            if ( (not self._subscribed) and ( int(time.time()) - self._init_time > 60) ) :
+                print( "quiting... participant did not join.")
+                self._app_quit = True
+            return self._app_quit
+
         def write_video():
-            while not self._app_quit:
-                if ( (not self._subscribed) and ( int(time.time()) - self._init_time > 60) ) :
-                    print( "quiting... participant did not join.")
-                    self._app_quit = True
-                else :
-                    data = self._video_buffer.getFromQueue()  
-                    if data : 
-                        self._camera.write_frame(  data.frames() )
-                    gc.collect()
+            if self._playout is not None :
+                run_playout( self._video_buffer, self._camera.write_frame, video_should_quit, gc_policy.tick )
+            else :
+                run_writer( self._video_buffer, self._camera.write_frame, video_should_quit, gc_policy.tick, quality=self._video_buffer.quality )
 
         self.__video_thread = threading.Thread(target=write_video)
         self.__video_thread.start()
 
         def write_audio():
-            while not self._app_quit:
-                data = self._audio_buffer.getFromQueue()
-                if data :
-                    self._microphone.write_frames( data.frames() )
+            if self._audio_output is not None :
+                on_write = self._playout.audio_written_at if self._playout is not None else None
+                run_audio_output( self._audio_buffer, self._audio_output, self._microphone.write_frames, lambda : self._app_quit, on_write=on_write )
+            else :
+                on_write = self._playout.audio_written if self._playout is not None else None
+                run_writer( self._audio_buffer, self._microphone.write_frames, lambda : self._app_quit, on_write=on_write )
 
         self.__audio_thread = threading.Thread(target=write_audio)
         self.__audio_thread.start()
 
+    def metrics(self):
+        return {
+            "bot"    : "echo_bot",
+            "room"   : self._url,
+            "pid"    : os.getpid(),
+            "streams": {
+                "audio": self._audio_buffer.metrics.snapshot( self._audio_buffer ),
+                "video": self._video_buffer.metrics.snapshot( self._video_buffer ),
+            },
+        }
+
     def run(self, url, token):
+        self._url = url
+        self._metrics_reporter.start()
         self._client.join(url, meeting_token=token, completion=self.on_joined)
+        # load cv2 while the join is in flight instead of on the first video frame
+        threading.Thread(target=load_cv2, daemon=True).start()
         self.__video_thread.join()
         self.__audio_thread.join()
 
     def leave(self):
         self._app_quit = True
+        self._metrics_reporter.stop()
         self._client.leave()
         self._client.release()
 
@@ -313,9 +786,11 @@ def main():
 
     print(f"main() echo_bot {delay} msec. : {url} ")
 
+    gc_policy.install()
     Daily.init()
     bot = EchoBot()
     bot.delay( int(delay)/1000.0)
+    gc_policy.after_startup()
 
     try: 
         bot.run(url, token)
@@ -329,6 +804,7 @@ def main():
 
     Daily.deinit()
 
+    print(f"gc {gc_policy.summary()}")
     print("Exited. process complete")
     
 if __name__ == "__main__":
@@ -0,0 +1,141 @@
+import asyncio
+import os
+import time
+
+import aiohttp
+
+
+FLY_IMAGE_TTL    = float(os.getenv("FLY_IMAGE_TTL", "300"))
+FLY_API_RETRIES  = int(os.getenv("FLY_API_RETRIES", "3"))
+FLY_API_BACKOFF  = float(os.getenv("FLY_API_BACKOFF", "0.25"))
+FLY_POOL_ROLE    = "bot-pool"
+
+IDEMPOTENT = ("GET", "HEAD", "DELETE")
+STOPPED    = ("stopping", "stopped", "suspended", "destroying", "destroyed")
+
+
+class FlyApiError(Exception) :
+    def __init__(self, method, path, status, text) :
+        super().__init__(f"Fly API {method} {path or '/'} failed ({status}): {text}")
+        self.status = status
+        self.text   = text
+
+
+def is_pool_machine(machine) :
+    return machine.get("config", {}).get("metadata", {}).get("role") == FLY_POOL_ROLE
+
+
+class FlyClient :
+    """Machines API client sharing one keep-alive aiohttp session.
+
+    The session is the one created in the server lifespan. The app image
+    is cached for `image_ttl` seconds and revalidated with If-None-Match.
+    Idempotent requests are retried with exponential backoff on connection
+    errors, 429 and 5xx; other requests only on 429.
+    """
+
+    def __init__(self, api_host, app_name, token, image_ttl=FLY_IMAGE_TTL, retries=FLY_API_RETRIES, backoff=FLY_API_BACKOFF) :
+        self.api_host   = api_host.rstrip("/")
+        self.app_name   = app_name
+        self.headers    = {
+            'Authorization': f"Bearer {token}",
+            'Content-Type': 'application/json'
+        }
+        self.image_ttl  = image_ttl
+        self.retries    = retries
+        self.backoff    = backoff
+        self.session    = None
+        self._image     = None
+        self._image_at  = 0.0
+        self._etag      = None
+        self._machines  = None
+        self._listed_at = None      # monotonic time the cached machine list was requested
+
+    @property
+    def machines_url(self) :
+        return f"{self.api_host}/apps/{self.app_name}/machines"
+
+    def open(self, session) :
+        self.session = session
+
+    async def _send(self, method, path, json, headers) :
+        async with self.session.request(method, f"{self.machines_url}{path}", headers=headers, json=json) as r:
+            if r.status == 304:
+                return r.status, None, r.headers.get("ETag")
+            if r.status != 200:
+                raise FlyApiError(method, path, r.status, await r.text())
+            data = await r.json() if r.content_type == "application/json" else None
+            return r.status, data, r.headers.get("ETag")
+
+    async def request(self, method, path="", json=None, headers=None) :
+        headers = {**self.headers, **(headers or {})}
+        attempt = 0
+        while True:
+            try:
+                return await self._send(method, path, json, headers)
+            except FlyApiError as e:
+                retryable = e.status == 429 or (e.status >= 500 and method in IDEMPOTENT)
+                if not retryable or attempt >= self.retries:
+                    raise
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if method not in IDEMPOTENT or attempt >= self.retries:
+                    raise
+            await asyncio.sleep(self.backoff * (2 ** attempt))
+            attempt += 1
+
+    async def machines(self) :
+        requested = time.monotonic()
+        headers   = {"If-None-Match": self._etag} if self._etag and self._machines is not None else None
+        status, data, etag = await self.request("GET", headers=headers)
+        if status != 304:
+            self._machines = data
+            self._etag     = etag
+        self._listed_at = requested
+        self._update_image(self._machines)
+        return self._machines
+
+    async def refresh_machines(self, max_age) :
+        if self._listed_at is None or time.monotonic() - self._listed_at > max_age:
+            await self.machines()
+
+    def machine_running(self, vm_id, since) :
+        """Whether `vm_id`, started at monotonic time `since`, is running in the cached machine list.
+
+        A list requested before `since` cannot tell, so the machine counts
+        as running until a newer list shows it stopped or gone.
+        """
+        if self._machines is None or self._listed_at is None or self._listed_at < since:
+            return True
+        machine = next((m for m in self._machines if m["id"] == vm_id), None)
+        return machine is not None and machine["state"] not in STOPPED
+
+    def _update_image(self, machines) :
+        if not machines:
+            return
+        image = next((m["config"]["image"] for m in machines if not is_pool_machine(m)), machines[0]["config"]["image"])
+        self._image    = image
+        self._image_at = time.monotonic()
+
+    async def image(self, refresh=False) :
+        if refresh or self._image is None or time.monotonic() - self._image_at > self.image_ttl:
+            await self.machines()
+        if self._image is None:
+            raise Exception(f"Unable to get machine info from Fly: no machines in {self.app_name}")
+        return self._image
+
+    async def create_machine(self, config, skip_launch=False) :
+        body = {"config": config}
+        if skip_launch:
+            body["skip_launch"] = True
+        _, data, _ = await self.request("POST", json=body)
+        return data
+
+    async def update_machine(self, vm_id, config) :
+        _, data, _ = await self.request("POST", f"/{vm_id}", json={"config": config})
+        return data
+
+    async def wait(self, vm_id, state="started") :
+        await self.request("GET", f"/{vm_id}/wait?state={state}")
+
+    async def destroy(self, vm_id) :
+        await self.request("DELETE", f"/{vm_id}?force=true")
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import time
+
+from fly_api import FLY_POOL_ROLE, is_pool_machine
+
+
+FLY_POOL_SIZE     = int(os.getenv("FLY_POOL_SIZE", "0"))
+FLY_POOL_MAX      = int(os.getenv("FLY_POOL_MAX", "0")) or None
+FLY_POOL_INTERVAL = float(os.getenv("FLY_POOL_INTERVAL", "30"))
+LEASE_TIMEOUT     = 120.0
+
+# bot machines report media metrics back to the server that spawned them
+BOT_ENV = { "BOT_METRICS_URL": f"{os.getenv('APP_HOST')}/metrics/report" } if os.getenv("APP_HOST") else {}
+
+GUEST = {
+    "cpu_kind": "shared",
+    "cpus": 1,
+    "memory_mb": 1024
+}
+
+
+def bot_cmd(bot_name, url, token, delay) :
+    return f"python3 -m {bot_name} -u {url} -t {token} -d {delay}".split()
+
+
+def machine_config(image, cmd, auto_destroy=True, metadata=None, env=None) :
+    config = {
+        "image": image,
+        "auto_destroy": auto_destroy,
+        "init": {
+            "cmd": cmd
+        },
+        "restart": {
+            "policy": "no"
+        },
+        "guest": dict(GUEST),
+    }
+    if metadata :
+        config["metadata"] = metadata
+    env = BOT_ENV if env is None else env
+    if env :
+        config["env"] = dict(env)
+    return config
+
+
+class FlyMachinePool :
+    """Standby Fly machines of the current image, leased one per room.
+
+    Pool machines are created stopped and are not auto-destroyed. A lease
+    rewrites the machine's init command with the room arguments, which
+    starts it; when the bot exits the machine stops and becomes a standby
+    machine again. A background task keeps `size` stopped machines of the
+    current image, replacing ones built from an older image.
+    """
+
+    def __init__(self, client, size=FLY_POOL_SIZE, max_size=FLY_POOL_MAX, interval=FLY_POOL_INTERVAL) :
+        self.client    = client
+        self.size      = size
+        self.max_size  = max_size or size * 4
+        self.interval  = interval
+        self.image     = None
+        self._task     = None
+        self._refills  = set()   # replenish tasks started by lease()
+        self._standby  = []      # ids of stopped pool machines of the current image
+        self._leased   = {}      # id -> lease time, until the machine is seen running
+        self._lock     = asyncio.Lock()
+
+    async def start(self) :
+        try:
+            await self.replenish()
+        except Exception as e:
+            print(f"Fly pool: initial replenish failed: {e}")
+        self._task = asyncio.create_task(self._maintain())
+
+    async def stop(self) :
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for refill in list(self._refills):
+            refill.cancel()
+        await asyncio.gather(*self._refills, return_exceptions=True)
+
+    async def _maintain(self) :
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.replenish()
+            except Exception as e:
+                print(f"Fly pool: replenish failed: {e}")
+
+    async def replenish(self) :
+        async with self._lock:
+            machines   = await self.client.machines()
+            self.image = await self.client.image()
+            now        = time.monotonic()
+
+            pool      = [m for m in machines if is_pool_machine(m)]
+            standby   = []
+            destroyed = 0
+            for machine in pool:
+                vm_id = machine["id"]
+                if machine["state"] != "stopped":
+                    self._leased.pop(vm_id, None)
+                    continue
+                if vm_id in self._leased and now - self._leased[vm_id] < LEASE_TIMEOUT:
+                    continue
+                self._leased.pop(vm_id, None)
+                if machine["config"]["image"] != self.image:
+                    print(f"Fly pool: destroying {vm_id} built from an old image")
+                    await self.client.destroy(vm_id)
+                    destroyed += 1
+                    continue
+                standby.append(vm_id)
+
+            missing = min(self.size - len(standby), self.max_size - (len(pool) - destroyed))
+            for _ in range(max(0, missing)):
+                standby.append( await self._create_standby() )
+
+            self._standby = standby
+
+    async def _create_standby(self) :
+        config = machine_config(self.image, ["python3", "-c", "pass"], auto_destroy=False,
+                                metadata={"role": FLY_POOL_ROLE})
+        data = await self.client.create_machine(config, skip_launch=True)
+        print(f"Fly pool: created standby machine {data['id']}")
+        return data["id"]
+
+    async def lease(self, bot_name, url, token, delay) :
+        async with self._lock:
+            vm_id = self._standby.pop(0) if self._standby else None
+            if vm_id is not None:
+                self._leased[vm_id] = time.monotonic()
+
+        if self.image is None or vm_id is None:
+            await self.replenish()
+            async with self._lock:
+                if not self._standby:
+                    raise Exception("No standby Fly machine available")
+                vm_id = self._standby.pop(0)
+                self._leased[vm_id] = time.monotonic()
+
+        config = machine_config(self.image, bot_cmd(bot_name, url, token, delay), auto_destroy=False,
+                                metadata={"role": FLY_POOL_ROLE})
+        await self.client.update_machine(vm_id, config)
+        await self.client.wait(vm_id, "started")
+        refill = asyncio.create_task(self._refill())
+        self._refills.add(refill)
+        refill.add_done_callback(self._refills.discard)
+        return vm_id
+
+    async def _refill(self) :
+        try:
+            await self.replenish()
+        except Exception as e:
+            print(f"Fly pool: replenish failed: {e}")
@@ -0,0 +1,103 @@
+import gc
+import os
+import threading
+import time
+
+
+GC_POLICY        = os.getenv("BOT_GC_POLICY", "freeze")     # default, freeze, budget or off
+GC_INTERVAL      = float(os.getenv("BOT_GC_INTERVAL", "5.0"))
+GC_FULL_INTERVAL = float(os.getenv("BOT_GC_FULL_INTERVAL", "60.0"))
+GC_REPORT        = float(os.getenv("BOT_GC_REPORT", "60.0"))
+
+
+class GcPolicy :
+    """Process-wide garbage collection policy for bot processes.
+
+    default : leave the interpreter's collector alone
+    freeze  : move startup objects to the permanent generation and raise
+              the young-generation threshold
+    budget  : disable automatic collection and collect the young generation
+              every GC_INTERVAL seconds, with a full pass every GC_FULL_INTERVAL
+    off     : disable automatic collection and only run the full pass
+
+    Collection pauses are timed through gc.callbacks whatever the mode.
+    """
+
+    def __init__(self, mode=GC_POLICY, interval=GC_INTERVAL, full_interval=GC_FULL_INTERVAL, report=GC_REPORT) :
+        if mode not in ("default", "freeze", "budget", "off") :
+            raise ValueError(f"Unknown gc policy {mode}")
+        self.mode           = mode
+        self.interval       = interval
+        self.full_interval  = full_interval
+        self.report         = report
+        self.collections    = 0
+        self.pause_total    = 0.0
+        self.pause_max      = 0.0
+        self._started       = None
+        self._lock          = threading.Lock()
+        self._installed     = False
+        now = time.monotonic()
+        self._last_young    = now
+        self._last_full     = now
+        self._last_report   = now
+
+    def install(self) :
+        if self._installed :
+            return
+        self._installed = True
+        gc.callbacks.append(self._on_gc)
+        if self.mode in ("budget", "off") :
+            gc.disable()
+        elif self.mode == "freeze" :
+            threshold = gc.get_threshold()
+            gc.set_threshold(max(threshold[0], 10000), *threshold[1:])
+
+    def after_startup(self) :
+        if self.mode != "default" :
+            gc.collect()
+            gc.freeze()
+
+    def tick(self) :
+        if self.mode not in ("budget", "off") and self.report <= 0.0 :
+            return
+        now = time.monotonic()
+        if not self._lock.acquire(blocking=False) :
+            return
+        try :
+            if self.mode in ("budget", "off") and now - self._last_full >= self.full_interval :
+                gc.collect()
+                self._last_full  = now
+                self._last_young = now
+            elif self.mode == "budget" and now - self._last_young >= self.interval :
+                gc.collect(0)
+                self._last_young = now
+            if self.report > 0.0 and now - self._last_report >= self.report :
+                self._last_report = now
+                print(f"gc {self.summary()}")
+        finally :
+            self._lock.release()
+
+    def stats(self) :
+        return {
+            "policy"      : self.mode,
+            "collections" : self.collections,
+            "pause_total" : self.pause_total,
+            "pause_max"   : self.pause_max,
+        }
+
+    def summary(self) :
+        return (f"policy={self.mode} collections={self.collections} "
+                f"pause_total={self.pause_total * 1000:.1f}ms pause_max={self.pause_max * 1000:.1f}ms")
+
+    def _on_gc(self, phase, info) :
+        if phase == "start" :
+            self._started = time.perf_counter()
+        elif self._started is not None :
+            pause = time.perf_counter() - self._started
+            self._started     = None
+            self.collections += 1
+            self.pause_total += pause
+            self.pause_max    = max(self.pause_max, pause)
+
+
+policy = GcPolicy()
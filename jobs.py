@@ -0,0 +1,162 @@
+import asyncio
+import collections
+import os
+import time
+import uuid
+
+
+BOT_START_CONCURRENCY = int(os.getenv("BOT_START_CONCURRENCY", "4"))
+BOT_START_QUEUE       = int(os.getenv("BOT_START_QUEUE", "64"))
+BOT_JOB_HISTORY       = int(os.getenv("BOT_JOB_HISTORY", "500"))
+BOT_JOB_TTL           = float(os.getenv("BOT_JOB_TTL", "3600"))     # seconds a finished job stays listed
+
+QUEUED   = "queued"
+SPAWNING = "spawning"
+JOINED   = "joined"
+FAILED   = "failed"
+EXITED   = "exited"
+
+ACTIVE   = (QUEUED, SPAWNING, JOINED)
+
+
+class BotJob :
+
+    def __init__(self, bot_name, url, token, delay) :
+        self.id        = uuid.uuid4().hex
+        self.bot_name  = bot_name
+        self.url       = url
+        self.token     = token
+        self.delay     = delay
+        self.state     = QUEUED
+        self.error     = None
+        self.created   = time.time()
+        self.updated   = self.created
+        self.alive     = None      # callable reporting whether the started bot is still running
+        self.exception = None
+
+    def set_state(self, state, error=None) :
+        self.state   = state
+        self.error   = error
+        self.updated = time.time()
+
+    def refresh(self) :
+        if self.state == JOINED and self.alive is not None and not self.alive() :
+            self.set_state(EXITED)
+        return self
+
+    def to_dict(self) :
+        return {
+            "id"      : self.id,
+            "bot"     : self.bot_name,
+            "url"     : self.url,
+            "delay"   : self.delay,
+            "state"   : self.state,
+            "error"   : self.error,
+            "created" : self.created,
+            "updated" : self.updated,
+        }
+
+
+class JobQueue :
+    """Bounded background queue for bot starts.
+
+    `starter(bot_name, url, token, delay)` does the actual start and returns
+    a callable telling whether the bot is still alive (or None if that is
+    not observable). At most `concurrency` starts run at once. Finished
+    jobs are listed for `ttl` seconds, and only the newest `history` of
+    them are kept.
+    """
+
+    def __init__(self, starter, concurrency=BOT_START_CONCURRENCY, maxsize=BOT_START_QUEUE, history=BOT_JOB_HISTORY, ttl=BOT_JOB_TTL) :
+        self.starter     = starter
+        self.concurrency = concurrency
+        self.history     = history
+        self.ttl         = ttl
+        self.jobs        = collections.OrderedDict()
+        self._pending    = collections.defaultdict(dict)   # url -> {job id: job} queued or spawning
+        self._queue      = asyncio.Queue(maxsize=maxsize)
+        self._workers    = []
+
+    def start(self) :
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self) :
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, bot_name, url, token, delay) :
+        job = BotJob(bot_name, url, token, delay)
+        self._queue.put_nowait(job)      # raises asyncio.QueueFull when saturated
+        self._track(job)
+        return job
+
+    async def run(self, bot_name, url, token, delay) :
+        # synchronous start, recorded like a queued job so /jobs and /bots see it
+        job = BotJob(bot_name, url, token, delay)
+        self._track(job)
+        await self._run(job)
+        if job.state == FAILED:
+            raise job.exception
+        return job
+
+    def get(self, job_id) :
+        job = self.jobs.get(job_id)
+        return job.refresh() if job is not None else None
+
+    def active(self, url=None) :
+        self._prune()
+        return [job for job in self.jobs.values() if job.refresh().state in ACTIVE and (url is None or job.url == url)]
+
+    def pending(self, url=None) :
+        if url is not None:
+            return list(self._pending.get(url, {}).values())
+        return [job for jobs in self._pending.values() for job in jobs.values()]
+
+    def _track(self, job) :
+        self.jobs[job.id] = job
+        self._pending[job.url][job.id] = job
+        self._prune()
+
+    def _unpend(self, job) :
+        jobs = self._pending.get(job.url)
+        if jobs is not None:
+            jobs.pop(job.id, None)
+            if not jobs:
+                del self._pending[job.url]
+
+    def _prune(self) :
+        # drop finished jobs past their ttl, then the oldest finished ones over history; live bots keep their entries
+        now      = time.time()
+        finished = [job_id for job_id, job in self.jobs.items() if job.refresh().state not in ACTIVE]
+        for job_id in finished:
+            if now - self.jobs[job_id].updated > self.ttl:
+                del self.jobs[job_id]
+        finished = [job_id for job_id in finished if job_id in self.jobs]
+        for job_id in finished[:max(0, len(self.jobs) - self.history)]:
+            del self.jobs[job_id]
+
+    async def _run(self, job) :
+        try:
+            job.set_state(SPAWNING)
+            job.alive = await self.starter(job.bot_name, job.url, job.token, job.delay)
+            job.set_state(JOINED)
+        except asyncio.CancelledError:
+            job.set_state(FAILED, "server shutting down")
+            raise
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            job.exception = e
+            job.set_state(FAILED, str(e))
+        finally:
+            job.token = None
+            self._unpend(job)
+
+    async def _worker(self) :
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
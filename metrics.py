@@ -0,0 +1,231 @@
+import json
+import os
+import threading
+import time
+
+
+BOT_METRICS_URL      = os.getenv("BOT_METRICS_URL", "")
+BOT_METRICS_INTERVAL = float(os.getenv("BOT_METRICS_INTERVAL", "5"))
+BOT_METRICS_MAX      = int(os.getenv("BOT_METRICS_MAX", "1000"))       # bots the server keeps reports for
+
+
+class StageTimer :
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self) :
+        self.count = 0
+        self.total = 0.0
+        self.max   = 0.0
+
+    def observe(self, seconds) :
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max :
+            self.max = seconds
+
+    def snapshot(self) :
+        snapshot   = {"count": self.count, "total": self.total, "max": self.max}
+        self.max   = 0.0       # max is per reporting interval
+        return snapshot
+
+
+class StreamMetrics :
+    """Counters for one media stream of one bot; updated from the media threads."""
+
+    def __init__(self) :
+        self.frames_in   = 0
+        self.frames_out  = 0
+        self.drops       = 0
+        self.delay       = 0.0      # achieved delay of the last frame read
+        self.skew        = 0.0      # audio playout position minus media time of the last video frame
+        self.duplicates  = 0        # video frames written again to hold sync with audio
+        self.quality_level = 0      # adaptive video quality level, 0 is full quality
+        self.evictions   = 0        # entries evicted to hold the buffer's byte and duration caps
+        self.underruns   = 0        # audio writes padded with silence
+        self.overruns    = 0        # times the audio jitter buffer was trimmed
+        self.convert     = StageTimer()
+        self.write       = StageTimer()
+        self._last       = (time.monotonic(), 0, 0)
+
+    def snapshot(self, buffer) :
+        now, frames_in, frames_out = self._last
+        elapsed    = max(time.monotonic() - now, 1e-6)
+        self._last = (time.monotonic(), self.frames_in, self.frames_out)
+        return {
+            "frames_in"      : self.frames_in,
+            "frames_out"     : self.frames_out,
+            "fps_in"         : (self.frames_in  - frames_in ) / elapsed,
+            "fps_out"        : (self.frames_out - frames_out) / elapsed,
+            "drops"          : self.drops,
+            "delay"          : self.delay,
+            "av_skew"        : self.skew,
+            "duplicates"     : self.duplicates,
+            "quality_level"  : self.quality_level,
+            "requested_delay": buffer._delay,
+            "buffer_length"  : len(buffer.buffer),
+            "buffer_bytes"   : buffer.buffer_bytes(),
+            "evictions"      : self.evictions,
+            "underruns"      : self.underruns,
+            "overruns"       : self.overruns,
+            "clock_resyncs"  : getattr(buffer.clock, "resyncs", 0),
+            "convert"        : self.convert.snapshot(),
+            "write"          : self.write.snapshot(),
+        }
+
+
+class MetricsReporter :
+    """Posts a bot's metrics snapshot as JSON to the server every interval."""
+
+    def __init__(self, snapshot, url=BOT_METRICS_URL, interval=BOT_METRICS_INTERVAL, api_key=os.getenv("API_KEY")) :
+        self.snapshot = snapshot
+        self.url      = url
+        self.interval = interval
+        self.api_key  = api_key
+        self._stop    = threading.Event()
+        self._thread  = None
+
+    def start(self) :
+        if not self.url :
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) :
+        self._stop.set()
+
+    def _run(self) :
+        import urllib.request       # only reporting bots pay for http.client
+        while not self._stop.wait(self.interval) :
+            try :
+                body    = json.dumps(self.snapshot()).encode()
+                headers = {"Content-Type": "application/json"}
+                if self.api_key :
+                    headers["X-Api-Key"] = self.api_key
+                request = urllib.request.Request(self.url, data=body, headers=headers)
+                urllib.request.urlopen(request, timeout=2).close()
+            except Exception as e:
+                print(f"Unable to report metrics: {e}")
+
+
+# ---------------------------------------------------------------------------
+# server side
+# ---------------------------------------------------------------------------
+
+STREAM_METRICS = [
+    # (name, snapshot key, type, help)
+    ("echo_bot_frames_in_total"       , "frames_in"      , "counter", "Frames received from Daily"),
+    ("echo_bot_frames_out_total"      , "frames_out"     , "counter", "Frames written to the virtual device"),
+    ("echo_bot_frames_in_per_second"  , "fps_in"         , "gauge"  , "Frames received per second over the last interval"),
+    ("echo_bot_frames_out_per_second" , "fps_out"        , "gauge"  , "Frames written per second over the last interval"),
+    ("echo_bot_queue_drops_total"     , "drops"          , "counter", "Frames dropped because the writer queue was full or playout skipped them"),
+    ("echo_bot_delay_seconds"         , "delay"          , "gauge"  , "Achieved delay of the last frame read"),
+    ("echo_bot_av_skew_seconds"       , "av_skew"        , "gauge"  , "Audio playout position minus the media time of the video frame shown"),
+    ("echo_bot_duplicate_frames_total", "duplicates"     , "counter", "Video frames written again to hold sync with audio"),
+    ("echo_bot_quality_level"         , "quality_level"  , "gauge"  , "Adaptive video quality level, 0 is full frame rate and interpolation"),
+    ("echo_bot_requested_delay_seconds", "requested_delay", "gauge" , "Requested delay after latency compensation"),
+    ("echo_bot_buffer_frames"         , "buffer_length"  , "gauge"  , "Frames held in the delay buffer"),
+    ("echo_bot_buffer_bytes"          , "buffer_bytes"   , "gauge"  , "Bytes held in the delay buffer"),
+    ("echo_bot_buffer_evictions_total", "evictions"      , "counter", "Buffered entries evicted to stay under the byte and duration caps"),
+    ("echo_bot_audio_underruns_total" , "underruns"      , "counter", "Microphone writes padded with silence because the jitter buffer ran short"),
+    ("echo_bot_audio_overruns_total"  , "overruns"       , "counter", "Times the audio jitter buffer was trimmed back to its target"),
+    ("echo_bot_clock_resyncs_total"   , "clock_resyncs"  , "counter", "Times the media clock re-anchored on arrival time"),
+]
+
+STAGE_METRICS = [
+    ("convert", "Time spent converting frames for the virtual device"),
+    ("write"  , "Time spent in write_frame / write_frames"),
+]
+
+
+def _escape(value) :
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(labels) :
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _number(value) :
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_snapshot(snapshot) :
+    """Raises ValueError unless `snapshot` has the shape StreamMetrics.snapshot() reports."""
+    if not isinstance(snapshot, dict) :
+        raise ValueError("metrics report must be a JSON object")
+    for field in ("bot", "room", "pid") :
+        value = snapshot.get(field)
+        if value is not None and not isinstance(value, (str, int)) :
+            raise ValueError(f"metrics report field {field} must be a string or an integer")
+    streams = snapshot.get("streams", {})
+    if not isinstance(streams, dict) :
+        raise ValueError("metrics report streams must be an object")
+    for stream, values in streams.items() :
+        if not isinstance(values, dict) :
+            raise ValueError(f"metrics for stream {stream} must be an object")
+        for key, value in values.items() :
+            if isinstance(value, dict) :
+                if not all(_number(v) for v in value.values()) :
+                    raise ValueError(f"metrics {stream}.{key} must hold numbers")
+            elif not _number(value) :
+                raise ValueError(f"metrics {stream}.{key} must be a number")
+
+
+class MetricsStore :
+    """Latest snapshot per bot, rendered in Prometheus text format.
+
+    Reports older than `ttl` are dropped on every update and scrape; past
+    `max_reports` bots the oldest report makes room for a new one.
+    """
+
+    def __init__(self, ttl=BOT_METRICS_INTERVAL * 3, max_reports=BOT_METRICS_MAX) :
+        self.ttl         = ttl
+        self.max_reports = max_reports
+        self.reports     = {}      # bot id -> (received, snapshot)
+
+    def update(self, snapshot) :
+        validate_snapshot(snapshot)
+        key = (snapshot.get("bot"), snapshot.get("room"), snapshot.get("pid"))
+        now = time.monotonic()
+        self._prune(now)
+        if key not in self.reports and len(self.reports) >= self.max_reports :
+            del self.reports[ min(self.reports, key=lambda k: self.reports[k][0]) ]
+        self.reports[key] = (now, snapshot)
+
+    def _prune(self, now) :
+        self.reports = {key: value for key, value in self.reports.items() if now - value[0] <= self.ttl}
+
+    def current(self) :
+        self._prune(time.monotonic())
+        return [snapshot for _, snapshot in self.reports.values()]
+
+    def render(self, gauges=None) :
+        lines     = []
+        snapshots = self.current()
+
+        for name, value, help in (gauges or []):
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+        for name, key, kind, help in STREAM_METRICS:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for snapshot in snapshots:
+                for stream, values in snapshot.get("streams", {}).items():
+                    labels = {"bot": snapshot.get("bot"), "room": snapshot.get("room"), "pid": snapshot.get("pid"), "stream": stream}
+                    lines.append(f"{name}{_labels(labels)} {values.get(key, 0)}")
+
+        for stage, help in STAGE_METRICS:
+            name = f"echo_bot_{stage}_seconds"
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} summary"]
+            for snapshot in snapshots:
+                for stream, values in snapshot.get("streams", {}).items():
+                    labels = {"bot": snapshot.get("bot"), "room": snapshot.get("room"), "pid": snapshot.get("pid"), "stream": stream}
+                    timer  = values.get(stage, {})
+                    lines.append(f"{name}_count{_labels(labels)} {timer.get('count', 0)}")
+                    lines.append(f"{name}_sum{_labels(labels)} {timer.get('total', 0.0)}")
+            lines += [f"# HELP {name}_max Slowest {stage} in the last interval", f"# TYPE {name}_max gauge"]
+            for snapshot in snapshots:
+                for stream, values in snapshot.get("streams", {}).items():
+                    labels = {"bot": snapshot.get("bot"), "room": snapshot.get("room"), "pid": snapshot.get("pid"), "stream": stream}
+                    lines.append(f"{name}_max{_labels(labels)} {values.get(stage, {}).get('max', 0.0)}")
+
+        return "\n".join(lines) + "\n"
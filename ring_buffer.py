@@ -0,0 +1,215 @@
+import math
+import numpy as np
+
+
+class RingBuffer :
+    """Bounded FIFO with O(1) append, eviction and indexed reads.
+
+    Indexing follows list semantics: 0 is the oldest entry, -1 the newest.
+    When the ring is full, append() evicts the oldest entry unless the
+    owner grow()s it first. Every entry also gets an absolute sequence
+    number that stays valid until it is evicted, and an arrival timestamp
+    kept in a parallel float64 array so that time lookups are a bisection
+    rather than a scan. Sizes passed to append() are kept per entry and
+    summed in `nbytes`.
+    """
+
+    def __init__(self, capacity) :
+        if capacity < 1 :
+            raise ValueError(f"RingBuffer capacity must be positive, got {capacity}")
+        self._slots    = [None] * capacity
+        self._times    = np.zeros(capacity, dtype=np.float64)
+        self._sizes    = np.zeros(capacity, dtype=np.int64)
+        self._nbytes   = 0
+        self._capacity = capacity
+        self._start    = 0     # slot of the oldest entry
+        self._count    = 0
+        self._next_seq = 0     # sequence number of the next append
+
+    @classmethod
+    def for_stream(cls, max_delay, rate, slack=1.0) :
+        return cls( max(1, math.ceil( (max_delay + slack) * rate )) )
+
+    @property
+    def capacity(self) :
+        return self._capacity
+
+    def __len__(self) :
+        return self._count
+
+    @property
+    def nbytes(self) :
+        return self._nbytes
+
+    def full(self) :
+        return self._count == self._capacity
+
+    def grow(self, capacity=None) :
+        """Reallocate with room for `capacity` entries (twice as many by default), keeping order and sequence numbers."""
+        capacity = capacity or self._capacity * 2
+        if capacity <= self._capacity :
+            return
+        order  = [ (self._start + index) % self._capacity for index in range(self._count) ]
+        slots  = [None] * capacity
+        times  = np.zeros(capacity, dtype=np.float64)
+        sizes  = np.zeros(capacity, dtype=np.int64)
+        slots[:self._count] = [ self._slots[slot] for slot in order ]
+        times[:self._count] = self._times[order]
+        sizes[:self._count] = self._sizes[order]
+        self._slots, self._times, self._sizes = slots, times, sizes
+        self._capacity = capacity
+        self._start    = 0
+
+    def _slot(self, index) :
+        if index < 0 :
+            index += self._count
+        if index < 0 or index >= self._count :
+            raise IndexError("RingBuffer index out of range")
+        return (self._start + index) % self._capacity
+
+    def __getitem__(self, index) :
+        return self._slots[ self._slot(index) ]
+
+    def time(self, index) :
+        return float( self._times[ self._slot(index) ] )
+
+    @property
+    def first_seq(self) :
+        return self._next_seq - self._count
+
+    @property
+    def last_seq(self) :
+        return self._next_seq - 1
+
+    def index_of(self, seq) :
+        return seq - self.first_seq
+
+    def at_seq(self, seq) :
+        return self[ self.index_of(seq) ]
+
+    def time_at_seq(self, seq) :
+        return self.time( self.index_of(seq) )
+
+    def search(self, timestamp) :
+        """Index of the newest entry whose time is <= timestamp (0 if none)."""
+        if self._count == 0 :
+            raise IndexError("search on an empty RingBuffer")
+        end = self._start + self._count
+        if end <= self._capacity :
+            index = int( np.searchsorted(self._times[self._start:end], timestamp, side="right") )
+        else :
+            older = self._times[self._start:]
+            index = int( np.searchsorted(older, timestamp, side="right") )
+            if index == len(older) :
+                index += int( np.searchsorted(self._times[:end - self._capacity], timestamp, side="right") )
+        return max(0, index - 1)
+
+    def append(self, item, timestamp=0.0, size=0) :
+        if self._count == self._capacity :
+            self.popleft()
+        slot = (self._start + self._count) % self._capacity
+        self._slots[ slot ] = item
+        self._times[ slot ] = timestamp
+        self._sizes[ slot ] = size
+        self._nbytes   += size
+        self._count    += 1
+        self._next_seq += 1
+
+    def popleft(self) :
+        if self._count == 0 :
+            raise IndexError("pop from an empty RingBuffer")
+        item = self._slots[ self._start ]
+        size = int( self._sizes[ self._start ] )
+        following = (self._start + 1) % self._capacity
+        if self._count > 1 and self._slots[ following ] is item :
+            # the next slot references this entry and now owns its bytes
+            self._sizes[ following ] += size
+        else :
+            self._nbytes -= size
+        self._slots[ self._start ] = None
+        self._sizes[ self._start ] = 0
+        self._start  = (self._start + 1) % self._capacity
+        self._count -= 1
+        return item
+
+    def resize(self, seq, size, item=None) :
+        """Charge the entry at `seq` with `size` bytes instead, e.g. once it is converted.
+
+        After `seq` is evicted its bytes live on in the oldest slot if that
+        slot still references `item`; that slot is recharged instead.
+        """
+        index = self.index_of(seq)
+        if index >= self._count :
+            return
+        if index < 0 :
+            if item is None or self._count == 0 or self[0] is not item :
+                return
+            index = 0
+        slot = self._slot(index)
+        self._nbytes      += size - int( self._sizes[ slot ] )
+        self._sizes[ slot ] = size
+
+    def pop(self, index=0) :
+        if index == 0 or index == -self._count :
+            return self.popleft()
+        raise IndexError("RingBuffer only supports popping the oldest entry")
+
+    def clear(self) :
+        self._slots  = [None] * self._capacity
+        self._sizes[:] = 0
+        self._nbytes = 0
+        self._start  = 0
+        self._count  = 0
+
+
+class PcmRingBuffer :
+    """Preallocated int16 PCM ring addressed by absolute sample position.
+
+    Incoming chunks are copied once into the ring; reads return the samples
+    at an absolute position as bytes, which is what the Daily virtual
+    microphone accepts.
+    """
+
+    def __init__(self, max_delay, sample_rate=48000, channels=1, slack=1.0) :
+        self.sample_rate = sample_rate
+        self.channels    = channels
+        self._capacity   = max(1, math.ceil( (max_delay + slack) * sample_rate )) * channels
+        self._pcm        = np.zeros(self._capacity, dtype=np.int16)
+        self._written    = 0       # total samples ever written
+
+    @property
+    def capacity(self) :
+        return self._capacity
+
+    @property
+    def written(self) :
+        return self._written
+
+    @property
+    def oldest(self) :
+        return max(0, self._written - self._capacity)
+
+    def write(self, frames) :
+        samples = np.frombuffer(frames, dtype=np.int16)
+        start   = self._written
+        if len(samples) > self._capacity :
+            self._written += len(samples) - self._capacity
+            samples        = samples[-self._capacity:]
+        count = len(samples)
+        pos   = self._written % self._capacity
+        first = min(count, self._capacity - pos)
+        self._pcm[pos:pos + first] = samples[:first]
+        self._pcm[:count - first]  = samples[first:]
+        self._written += count
+        return start
+
+    def read(self, start, count) :
+        start = max(start, self.oldest)
+        count = min(count, self._written - start)
+        if count <= 0 :
+            return b""
+        pos = start % self._capacity
+        if pos + count <= self._capacity :
+            return self._pcm[pos:pos + count].tobytes()
+        first = self._capacity - pos
+        return self._pcm[pos:].tobytes() + self._pcm[:count - first].tobytes()
@@ -1,20 +1,29 @@
 
 import aiohttp
+import asyncio
 import os
+import time
 import argparse
-import subprocess
-import sys
 import uvicorn
 
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 from pydantic import BaseModel
 from dotenv import load_dotenv  # Import dotenv to load .env file
 
+from bot_host import BotHostPool, BOT_CLASSES
+from bot_registry import BotRegistry, BOT_REGISTRY_RELOAD
+from fly_api import FlyClient
+from fly_pool import FlyMachinePool, FLY_POOL_SIZE, bot_cmd, machine_config
+from jobs import JobQueue
+from supervisor import BotSupervisor
+from admission import AdmissionController, ADMISSION_RETRY
+from metrics import MetricsStore
+
 # Define a Pydantic model to parse the incoming JSON body
 class StartAgentRequest(BaseModel):
     url: str
@@ -22,15 +31,26 @@ class StartAgentRequest(BaseModel):
 
 MAX_BOTS_PER_ROOM = 1
 
-# Bot sub-process dict for status reporting and concurrency control
-bot_procs = {}
+# Bot sub-processes for status reporting and concurrency control
+bot_procs = BotSupervisor()
 daily_helpers = {}
 
 load_dotenv()
 
-bots   = [ "silent_bot", "echo_bot" , "echo_bot" , "echo_bot" , "echo_bot" , "echo_bot", "echo_bot" , "echo_bot" ]
-props  = [ "0"         , "0"        , "250"      , "500"      , "750"      , "1000"    , "1500"     , "2000"     ]
-paths  = [ f"{bot}_{prop}" for bot,prop in zip(bots,props) ]
+# Bot host workers: when > 0, process mode runs bots inside long-lived workers
+# that each host up to BOT_HOST_ROOMS rooms instead of one process per room.
+# BOT_POOL_IDLE keeps that many pre-initialized workers waiting for a room;
+# with BOT_HOST_ROOMS=1 this is a warm pool of one-bot processes.
+BOT_HOST_WORKERS     = int(os.getenv("BOT_HOST_WORKERS", "0"))
+BOT_HOST_ROOMS       = int(os.getenv("BOT_HOST_ROOMS", "8"))
+BOT_POOL_IDLE        = int(os.getenv("BOT_POOL_IDLE", "0"))
+BOT_HOST_MAX_WORKERS = int(os.getenv("BOT_HOST_MAX_WORKERS", "0")) or None
+bot_host_pool        = None
+if BOT_HOST_WORKERS > 0 or BOT_POOL_IDLE > 0:
+    bot_host_pool = BotHostPool(BOT_HOST_WORKERS, BOT_HOST_ROOMS, idle=BOT_POOL_IDLE, max_workers=BOT_HOST_MAX_WORKERS)
+
+# Bot endpoints, one per entry of bots.json (or BOT_REGISTRY): POST /<path> starts <bot> with <delay>
+bot_registry = BotRegistry(known=BOT_CLASSES)
 
 
 async def register_bot(aiohttp_session, config, available: bool):
@@ -38,29 +58,23 @@ async def register_bot(aiohttp_session, config, available: bool):
     server = os.getenv("BIRDCONV_SERVER")
     birdconv_url = f"{server}/api/register"
 
-    payload = { "bots": {} }
-    
-    for bot,path  in zip(bots,paths) :
-        payload["bots"][ f"{path}"] = {
-            "uid"      : os.getenv("API_KEY"),
-            "service"  : f"{APP_HOST}/{path}",
-            "available": available
-        }
+    await bot_registry.register(aiohttp_session, birdconv_url, os.getenv("API_KEY"), APP_HOST, available)
 
-    try:
-        async with aiohttp_session.post(birdconv_url, json=payload) as response:
-            if response.status != 200:
-                print(f"Failed to register bot: {response.status}")
-            else:
-                print(f"Bot {'registered' if available else 'unregistered'} successfully.")
-    except Exception as e:
-        print(f"Error registering bot: {e}")
 
-def cleanup():
-    for entry in bot_procs.values():
-        proc = entry[0]
-        proc.terminate()
-        proc.wait()
+async def watch_registry(aiohttp_session, config):
+    # pick up bots.json edits without a restart and register only what changed
+    while True:
+        await asyncio.sleep(BOT_REGISTRY_RELOAD)
+        if bot_registry.reload():
+            available = admission.available if RUN_AS_PROCESS else True
+            await register_bot(aiohttp_session, config, available=available)
+
+async def cleanup():
+    # stop bot hosts and bot processes in parallel
+    stops = [bot_procs.shutdown()]
+    if bot_host_pool is not None:
+        stops.append(asyncio.to_thread(bot_host_pool.stop))
+    await asyncio.gather(*stops)
 
 
 def configure() :
@@ -80,24 +94,61 @@ async def lifespan(app: FastAPI):
 
     print(f"Starting FastAPI server on {config.host}:{config.port}")
 
-    aiohttp_session = aiohttp.ClientSession()
+    # bots started from here inherit where to report their media metrics
+    os.environ.setdefault("BOT_METRICS_URL", f"http://127.0.0.1:{config.port}/metrics/report")
+
+    if RUN_AS_PROCESS and bot_host_pool is not None:
+        bot_host_pool.start()
+
+    # one keep-alive connection pool shared by birdconv registration and the Fly API
+    aiohttp_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, keepalive_timeout=HTTP_KEEPALIVE))
+    fly_client.open(aiohttp_session)
+
+    if not RUN_AS_PROCESS and fly_pool is not None:
+        await fly_pool.start()
+
+    start_jobs.start()
+
+    if RUN_AS_PROCESS:
+        async def update_availability(available):
+            await register_bot(aiohttp_session, config, available=available)
+        admission.start(update_availability)
+
     await register_bot(aiohttp_session,config, available=True)
 
+    watches = []
+    if BOT_REGISTRY_RELOAD > 0:
+        watches.append(asyncio.create_task(watch_registry(aiohttp_session, config)))
+    if not RUN_AS_PROCESS:
+        watches.append(asyncio.create_task(watch_fly_machines()))
+
     yield
 
     # await register_bot(aiohttp_session,config, available=False)
+    for watch in watches:
+        watch.cancel()
+    await asyncio.gather(*watches, return_exceptions=True)
+    await admission.stop()
+    await start_jobs.stop()
+    if fly_pool is not None:
+        await fly_pool.stop()
     await aiohttp_session.close()
-    cleanup()
+    await cleanup()
 
 APP_HOST        = os.getenv("APP_HOST","http://0.0.0.0")
 RUN_AS_PROCESS  = os.getenv("RUN_AS_PROCESS", "true").lower() == "true"
+ASYNC_START     = os.getenv("ASYNC_START", "false").lower() == "true"
 FLY_API_HOST    = os.getenv("FLY_API_HOST", "https://api.machines.dev/v1")
 FLY_APP_NAME    = os.getenv("FLY_APP_NAME", "docker-bot")
 FLY_API_TOKEN   = os.getenv("FLY_API_TOKEN", "")
-FLY_HEADERS     = {
-    'Authorization': f"Bearer {FLY_API_TOKEN}",
-    'Content-Type': 'application/json'
-}
+HTTP_POOL_SIZE  = int(os.getenv("HTTP_POOL_SIZE", "32"))
+HTTP_KEEPALIVE  = float(os.getenv("HTTP_KEEPALIVE", "60"))
+FLY_MACHINES_REFRESH = float(os.getenv("FLY_MACHINES_REFRESH", "10"))   # seconds between machine state checks for joined bots
+
+fly_client = FlyClient(FLY_API_HOST, FLY_APP_NAME, FLY_API_TOKEN)
+
+# Standby Fly machines leased per room; FLY_POOL_SIZE=0 spawns a fresh machine per room
+fly_pool = FlyMachinePool(fly_client) if FLY_POOL_SIZE > 0 else None
 
 app = FastAPI(lifespan=lifespan)
 
@@ -110,124 +161,194 @@ app.add_middleware(
 )
 
 async def spawn_fly_machine(bot_name: str, url: str, token: str, delay:str):
-    async with aiohttp.ClientSession() as session:
-        # Use the same image as the bot runner
-        async with session.get(f"{FLY_API_HOST}/apps/{FLY_APP_NAME}/machines", headers=FLY_HEADERS) as r:
-            if r.status != 200:
-                text = await r.text()
-                raise Exception(f"Unable to get machine info from Fly: {text}")
-
-            data = await r.json()
-            image = data[0]['config']['image']
-
-        # Machine configuration
-        cmd = f"python3 -m {bot_name} -u {url} -t {token} -d {delay}"
-        cmd = cmd.split()
-        worker_props = {
-            "config": {
-                "image": image,
-                "auto_destroy": True,
-                "init": {
-                    "cmd": cmd
-                },
-                "restart": {
-                    "policy": "no"
-                },
-                "guest": {
-                    "cpu_kind": "shared",
-                    "cpus": 1,
-                    "memory_mb": 1024
-                }
-            },
-        }
-
-        # Spawn a new machine instance
-        async with session.post(f"{FLY_API_HOST}/apps/{FLY_APP_NAME}/machines", headers=FLY_HEADERS, json=worker_props) as r:
-            if r.status != 200:
-                text = await r.text()
-                raise Exception(f"Problem starting a bot worker: {text}")
-
-            data = await r.json()
-            # Wait for the machine to enter the started state
-            vm_id = data['id']
-
-        async with session.get(f"{FLY_API_HOST}/apps/{FLY_APP_NAME}/machines/{vm_id}/wait?state=started", headers=FLY_HEADERS) as r:
-            if r.status != 200:
-                text = await r.text()
-                raise Exception(f"Bot was unable to enter started state: {text}")
+    # Use the same image as the bot runner
+    image = await fly_client.image()
+
+    # Spawn a new machine instance
+    try:
+        data = await fly_client.create_machine(machine_config(image, bot_cmd(bot_name, url, token, delay)))
+    except Exception as e:
+        raise Exception(f"Problem starting a bot worker: {e}")
 
+    # Wait for the machine to enter the started state
+    try:
+        await fly_client.wait(data['id'], "started")
+    except Exception as e:
+        raise Exception(f"Bot was unable to enter started state: {e}")
+    return data['id']
 
-async def check_and_run( bot_name , url, token, delay):
 
-    if not bot_name:
-        raise HTTPException(status_code=500,detail="Missing 'bot_name' property in request data. Cannot start agent")
+async def refresh_fly_machines(max_age=FLY_MACHINES_REFRESH):
+    # joined Fly bots are alive while their machine runs; keep the machine list recent enough to tell
+    if RUN_AS_PROCESS:
+        return
+    try:
+        await fly_client.refresh_machines(max_age)
+    except Exception as e:
+        print(f"Unable to refresh Fly machine states: {e}")
+
+
+async def watch_fly_machines():
+    while True:
+        await asyncio.sleep(FLY_MACHINES_REFRESH)
+        if start_jobs.active():
+            await refresh_fly_machines()
+
+
+def bots_in_room(url):
+    if RUN_AS_PROCESS and bot_host_pool is not None:
+        running = bot_host_pool.room_count(url)
+    elif RUN_AS_PROCESS:
+        running = bot_procs.room_count(url)
+    else:
+        # Fly bots: jobs that are queued, spawning, or joined to a running machine
+        return len(start_jobs.active(url))
+    # queued and spawning starts count too, so a burst cannot double-book a room
+    return running + len(start_jobs.pending(url))
 
-    if not url :
-        raise HTTPException(status_code=500,detail="Missing 'url' property in request data. Cannot start agent")
-    
-    if not token:
-        raise HTTPException(status_code=500,detail="Missing 'token' property in request data. Cannot start agent")
 
-    if RUN_AS_PROCESS :
+async def start_bot(bot_name, url, token, delay):
+    # returns a callable reporting whether the bot is still running, or None if unknown
+
+    if RUN_AS_PROCESS and bot_host_pool is not None:
+
+        print(f"Dispatching to bot host {bot_name} {url} {delay}")
+
+        try:
+            bot_host_pool.dispatch(bot_name, url, token, delay)
+        except Exception as e:
+            raise HTTPException(status_code=503, detail=f"Failed to dispatch bot: {e}")
+        return lambda: bot_host_pool.room_count(url) > 0
+
+    elif RUN_AS_PROCESS :
 
         print(f"Running as a process {bot_name} {url} {delay}")
 
-        num_bots_in_room = sum(1 for proc in bot_procs.values() if proc[1] == url and proc[0].poll() is None)
-        if num_bots_in_room >= MAX_BOTS_PER_ROOM:
-            return JSONResponse({"message": f"Agent already started for room {url}"})
         try:
-            proc = subprocess.Popen([f"python3 -m {bot_name} -u {url} -t {token} -d {delay}"],shell=True,stdout=sys.stdout, bufsize=1, cwd=os.path.dirname(os.path.abspath(__file__) ), text=True   )
-            bot_procs[proc.pid] = (proc, url)
+            proc = await bot_procs.spawn(bot_name, url, token, delay)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to start subprocess: {e}")
+        return lambda: bot_procs.alive(proc.pid)
+
     else:
 
         print(f"Spawning machine {bot_name} {url} {delay}")
         
         try:
-            await spawn_fly_machine(bot_name, url, token, delay)
+            if fly_pool is not None:
+                vm_id = await fly_pool.lease(bot_name, url, token, delay)
+            else:
+                vm_id = await spawn_fly_machine(bot_name, url, token, delay)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to spawn VM: {e}")
-        
-    print(f"Machine joined room: {url}")
-    
-    return JSONResponse({"message": f"{bot_name} started for room {url}"})
 
-@app.get(f"/test")
-async def start_agent():
-    return JSONResponse({"message": f"{FLY_APP_NAME} started for url {APP_HOST}"})
+        started = time.monotonic()
+        print(f"Machine {vm_id} joined room: {url}")
+        return lambda: fly_client.machine_running(vm_id, started)
+
+
+start_jobs = JobQueue(start_bot)
+
+
+def live_bots():
+    running = len(bot_procs)
+    if bot_host_pool is not None:
+        running += bot_host_pool.rooms()
+    return running + len(start_jobs.pending())
+
+def bot_pids():
+    # idle warm workers host no bots, so sampling them would inflate the per-bot estimate
+    pids = list(bot_procs.procs)
+    if bot_host_pool is not None:
+        pids += bot_host_pool.pids(hosting=True)
+    return pids
 
-@app.post(f"/{paths[0]}")
-async def start_agent_0(request: StartAgentRequest):
-    return await check_and_run(bots[0], request.url, request.token, props[0] )
+# Host budgets only apply when bots run on this host
+admission = AdmissionController(bot_pids, live_bots)
 
-@app.post(f"/{paths[1]}")
-async def start_agent_1(request: StartAgentRequest):
-    return await check_and_run(bots[1], request.url, request.token, props[1] )
 
-@app.post(f"/{paths[2]}")
-async def start_agent_2(request: StartAgentRequest):
-    return await check_and_run(bots[2], request.url, request.token, props[2] )
+async def check_and_run( bot_name , url, token, delay):
+
+    if not bot_name:
+        raise HTTPException(status_code=500,detail="Missing 'bot_name' property in request data. Cannot start agent")
+
+    if not url :
+        raise HTTPException(status_code=500,detail="Missing 'url' property in request data. Cannot start agent")
+    
+    if not token:
+        raise HTTPException(status_code=500,detail="Missing 'token' property in request data. Cannot start agent")
+
+    if bots_in_room(url) >= MAX_BOTS_PER_ROOM:
+        return JSONResponse({"message": f"Agent already started for room {url}"})
 
-@app.post(f"/{paths[3]}")
-async def start_agent_3(request: StartAgentRequest):
-    return  await check_and_run(bots[3], request.url, request.token, props[3] )
+    if RUN_AS_PROCESS:
+        admitted, reason = admission.admit()
+        if not admitted:
+            print(f"Refusing {bot_name} for room {url}: {reason}")
+            raise HTTPException(status_code=503, detail=f"Host is over capacity: {reason}", headers={"Retry-After": str(ADMISSION_RETRY)})
 
-@app.post(f"/{paths[4]}")
-async def start_agent_4(request: StartAgentRequest):
-    return await check_and_run(bots[4], request.url, request.token, props[4] )
+    if ASYNC_START:
+        try:
+            job = start_jobs.submit(bot_name, url, token, delay)
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=503, detail="Too many pending bot starts", headers={"Retry-After": "5"})
+        return JSONResponse({"message": f"{bot_name} queued for room {url}", "job": job.id, "status": f"/jobs/{job.id}"}, status_code=202)
 
-@app.post(f"/{paths[5]}")
-async def start_agent_5(request: StartAgentRequest):
-    return await check_and_run(bots[5], request.url, request.token, props[5] )
+    await start_jobs.run(bot_name, url, token, delay)
+    
+    return JSONResponse({"message": f"{bot_name} started for room {url}"})
 
-@app.post(f"/{paths[6]}")
-async def start_agent_6(request: StartAgentRequest):
-    return await check_and_run(bots[6], request.url, request.token, props[6] )
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    await refresh_fly_machines(max_age=FLY_MACHINES_REFRESH / 5)
+    job = start_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return JSONResponse(job.to_dict())
+
+@app.get("/bots")
+async def get_bots():
+    await refresh_fly_machines(max_age=FLY_MACHINES_REFRESH / 5)
+    return JSONResponse({"bots": [job.to_dict() for job in start_jobs.active()]})
+
+bot_metrics = MetricsStore()
+
+@app.post("/metrics/report")
+async def report_metrics(request: Request):
+    api_key = os.getenv("API_KEY")
+    if api_key and request.headers.get("X-Api-Key") != api_key:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    try:
+        bot_metrics.update(await request.json())
+    except ValueError as e:      # json.JSONDecodeError is a ValueError too
+        raise HTTPException(status_code=400, detail=f"Invalid metrics report: {e}")
+    return JSONResponse({"message": "ok"})
+
+@app.get("/metrics")
+async def get_metrics():
+    gauges = [
+        ("bot_server_live_bots"    , live_bots()              , "Bots running or starting on this host"),
+        ("bot_server_pending_starts", len(start_jobs.pending()), "Bot starts queued or spawning"),
+    ]
+    if RUN_AS_PROCESS:
+        gauges += [
+            ("bot_server_bot_cpu_cores", admission.cpu          , "CPU cores used by bot processes"),
+            ("bot_server_bot_rss_bytes", admission.rss          , "Resident memory of bot processes"),
+            ("bot_server_available"    , int(admission.available), "Whether the host accepts new bots"),
+        ]
+    return PlainTextResponse(bot_metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+@app.get(f"/test")
+async def test():
+    return JSONResponse({"message": f"{FLY_APP_NAME} started for url {APP_HOST}"})
 
-@app.post(f"/{paths[7]}")
-async def start_agent_7(request: StartAgentRequest):
-    return await check_and_run(bots[7], request.url, request.token, props[7] )
+# keep this route last so it cannot shadow the fixed ones above
+@app.post("/{path}")
+async def start_agent(path: str, request: StartAgentRequest):
+    entry = bot_registry.get(path)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Unknown bot {path}")
+    return await check_and_run(entry.bot, request.url, request.token, entry.delay)
 
 if __name__ == "__main__":
 
@@ -0,0 +1,32 @@
+from functools import lru_cache
+
+
+BYTES_PER_PIXEL = {
+    "RGBA" : 4,
+    "BGRA" : 4,
+    "ARGB" : 4,
+    "ABGR" : 4,
+    "RGBX" : 4,
+    "BGRX" : 4,
+    "RGB"  : 3,
+    "BGR"  : 3,
+}
+
+# Silence and blank frames are immutable, so every muted frame of a given
+# shape can share one zero buffer instead of allocating a new one.
+
+@lru_cache(maxsize=64)
+def silent_audio(num_audio_frames, num_channels=1, bits_per_sample=16) :
+    return bytes( num_audio_frames * num_channels * bits_per_sample // 8 )
+
+@lru_cache(maxsize=16)
+def blank_frame(width, height, color_format="RGBA") :
+    if color_format == "I420" :
+        return bytes( width * height * 3 // 2 )
+    return bytes( width * height * BYTES_PER_PIXEL[color_format] )
+
+def silent_audio_for(data) :
+    return silent_audio(data.num_audio_frames, data.num_channels, data.bits_per_sample)
+
+def blank_frame_for(frame) :
+    return blank_frame(frame.width, frame.height, frame.color_format)
@@ -1,43 +1,63 @@
 import time
 import threading
-import json
-from typing import Mapping
-from   daily import *
+from   daily import Daily, CallClient, EventHandler
 from   runner import configure
-import cv2
-from PIL import Image
-import struct
-import numpy as np
+from   silence import silent_audio_for, blank_frame_for
+from   gc_policy import policy as gc_policy
+
+MAX_BUFFERED_SECONDS = 5.0     # delay start (max delay + 2s) plus a second of slack
 
 class BufferedAudioData :
     def __init__(self, data) :
         self.data        = data
         self.silent      = False
         self.dt          = data.num_audio_frames / data.sample_rate
+
+    def nbytes(self) :
+        return len(self.data.audio_frames)
     
     def frames(self) :
         # RETURN SILENT FRAMES
         # return self.data.audio_frames
         # if self.silent :
-        return bytes([0] * int(self.data.num_audio_frames * self.data.num_channels * self.data.bits_per_sample / 8) )
+        return silent_audio_for(self.data)
         # else :  
         #     return self.data.audio_frames
         
 class MediaBuffer : 
 
-    def __init__(self) :
+    def __init__(self, max_duration=MAX_BUFFERED_SECONDS) :
         self.buffer       = []
         self.elapsed_time = 0.0
         self._delay       = 0.0
         self.read_index   = 0
         self.buffer_ready = False
+        self.max_duration = max_duration
+        self.held         = 0.0     # seconds of media in the buffer
+        self.nbytes       = 0       # bytes held by buffered entries
+        self.evictions    = 0
 
     def pop(self) :
         if not self.buffer_ready :
             self.read_index = self._find_index()
             self.buffer_ready = True
 
-        return self.buffer.pop( self.read_index )
+        data = self.buffer.pop( self.read_index )
+        self.held   -= data.dt
+        self.nbytes -= data.nbytes()
+        return data
+
+    def store(self, data) :
+        # evict on append, so the buffer stays bounded even before a device exists to drain it
+        self.buffer.append( data )
+        self.held   += data.dt
+        self.nbytes += data.nbytes()
+        while self.held > self.max_duration and len(self.buffer) > 1 :
+            oldest           = self.buffer.pop(0)
+            self.held       -= oldest.dt
+            self.nbytes     -= oldest.nbytes()
+            self.read_index  = max(0, self.read_index - 1)
+            self.evictions  += 1
     
     def _find_index(self) :
 
@@ -65,7 +85,7 @@ class AudioBuffer(MediaBuffer) :
             buffered_audio_data.silent = True
 
         self.elapsed_time += buffered_audio_data.dt
-        self.buffer.append( buffered_audio_data )
+        self.store( buffered_audio_data )
 
 
     def delay(self, value):
@@ -75,12 +95,25 @@ class AudioBuffer(MediaBuffer) :
             self.buffer[i].silent = True
 
 
+class FrameShape :
+    # only blank frames are written, so buffered video keeps the shape and drops the pixels
+    __slots__ = ("width", "height", "color_format")
+
+    def __init__(self, frame) :
+        self.width        = frame.width
+        self.height       = frame.height
+        self.color_format = frame.color_format
+
+
 class BufferedVideoData :
     def __init__(self, data, dt) :
-        self.data   = data
+        self.data   = FrameShape(data)
         self.timestamp_us = data.timestamp_us
         self.dt           = dt   
 
+    def nbytes(self) :
+        return 0
+
     def width(self) :
         return self.data.height
     
@@ -88,13 +121,11 @@ class BufferedVideoData :
         return self.data.width
 
     def frames(self) :
-        image         = np.array( Image.frombytes(self.data.color_format, (self.data.width, self.data.height), self.data.buffer) ) 
-        rotated_frame = cv2.rotate( image , cv2.ROTATE_90_CLOCKWISE)
-        image         = Image.fromarray(rotated_frame)
         # BLANK OUT THE BUFFER
-        # buffer = image.tobytes()
-        buffer = bytes([0] * len(self.data.buffer))
-        return buffer
+        # image         = np.array( Image.frombytes(self.data.color_format, (self.data.width, self.data.height), self.data.buffer) ) 
+        # rotated_frame = cv2.rotate( image , cv2.ROTATE_90_CLOCKWISE)
+        # return Image.fromarray(rotated_frame).tobytes()
+        return blank_frame_for(self.data)
     
 class VideoBuffer(MediaBuffer) : 
     def __init__(self) :
@@ -113,7 +144,7 @@ class VideoBuffer(MediaBuffer) :
             buffered_video_data = BufferedVideoData( data, (data.timestamp_us - self.buffer[ len(self.buffer) -1 ].timestamp_us)/1_000_000.0 )
 
         self.elapsed_time += buffered_video_data.dt
-        self.buffer.append( buffered_video_data )
+        self.store( buffered_video_data )
 
 
 
@@ -221,9 +252,10 @@ class SilentBot(EventHandler):
             # import traceback
             # traceback.print_exc()
 
-    def __init__(self):
+    def __init__(self, device_suffix=""):
 
         self._subscribed  = False
+        self._device_suffix = device_suffix
         self._audio_buffer = AudioBuffer()
         self._video_buffer = VideoBuffer()
         # SET DELAY TO 0
@@ -242,6 +274,7 @@ class SilentBot(EventHandler):
         def wait_until_done():
             while not self._app_quit:
                 time.sleep(0.1)
+                gc_policy.tick()
 
         self.__thread = threading.Thread(target=wait_until_done)
         self.__thread.start()
@@ -261,7 +294,7 @@ class SilentBot(EventHandler):
         
         if audio_data :
             if (self._microphone is None) :
-                self._microphone = Daily.create_microphone_device("mic", sample_rate=audio_data.sample_rate , channels=audio_data.num_channels)
+                self._microphone = Daily.create_microphone_device(f"mic{self._device_suffix}", sample_rate=audio_data.sample_rate , channels=audio_data.num_channels)
 
             self._audio_buffer.append( audio_data ) 
 
@@ -274,7 +307,7 @@ class SilentBot(EventHandler):
 
         if video_frame:
             if (self._camera is None and self._video_buffer.elapsed_time >=2.0 ) :
-                self._camera = Daily.create_camera_device("cam",width=video_frame.height, height=video_frame.width, color_format=video_frame.color_format)
+                self._camera = Daily.create_camera_device(f"cam{self._device_suffix}",width=video_frame.height, height=video_frame.width, color_format=video_frame.color_format)
                 print( f"self._camera {self._camera.width} {self._camera.height} {self._camera.color_format}" )
 
             if (self._registered == False) :
@@ -290,8 +323,8 @@ class SilentBot(EventHandler):
         if (self._camera is not None and  self._microphone is not None ) :
             self._registered = True
             self._client.update_inputs({
-                "camera"    : { "isEnabled": True, "settings": {"deviceId": "cam" } },
-                "microphone": { "isEnabled": True, "settings": {"deviceId": "mic" } }
+                "camera"    : { "isEnabled": True, "settings": {"deviceId": f"cam{self._device_suffix}" } },
+                "microphone": { "isEnabled": True, "settings": {"deviceId": f"mic{self._device_suffix}" } }
             })
 
 def main():
@@ -299,9 +332,11 @@ def main():
 
     print(f"silent_bot: {url} {token} {delay}")
 
+    gc_policy.install()
     Daily.init()
     bot = SilentBot()
     bot.delay( int(delay)/1000.0)
+    gc_policy.after_startup()
 
     try: 
         bot.run(url, token)
@@ -314,6 +349,7 @@ def main():
 
     Daily.deinit()
 
+    print(f"gc {gc_policy.summary()}")
     print("Exited.")
     
 if __name__ == "__main__":
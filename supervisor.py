@@ -0,0 +1,65 @@
+import asyncio
+import collections
+import os
+import sys
+
+
+class BotSupervisor :
+    """Runs bot subprocesses on the event loop and reaps them as they exit.
+
+    Every child gets a watcher task that awaits its exit and drops it from
+    the process table and the per-room index, so no zombies or dead
+    entries accumulate and room occupancy is a set lookup.
+    """
+
+    def __init__(self, cwd=None) :
+        self.cwd       = cwd or os.path.dirname(os.path.abspath(__file__))
+        self.procs     = {}                              # pid -> (process, url)
+        self.rooms     = collections.defaultdict(set)    # url -> pids
+        self._watchers = set()
+
+    def __len__(self) :
+        return len(self.procs)
+
+    def room_count(self, url) :
+        return len(self.rooms.get(url, ()))
+
+    def alive(self, pid) :
+        return pid in self.procs
+
+    async def spawn(self, bot_name, url, token, delay) :
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", bot_name, "-u", url, "-t", token, "-d", str(delay),
+            cwd=self.cwd)
+        self.procs[proc.pid] = (proc, url)
+        self.rooms[url].add(proc.pid)
+        watcher = asyncio.create_task(self._watch(proc, url))
+        self._watchers.add(watcher)
+        watcher.add_done_callback(self._watchers.discard)
+        return proc
+
+    async def _watch(self, proc, url) :
+        returncode = await proc.wait()
+        self.procs.pop(proc.pid, None)
+        pids = self.rooms.get(url)
+        if pids is not None:
+            pids.discard(proc.pid)
+            if not pids:
+                del self.rooms[url]
+        print(f"Bot process {proc.pid} for {url} exited with {returncode}")
+
+    async def shutdown(self, timeout=10.0) :
+        procs = [proc for proc, _ in self.procs.values()]
+        for proc in procs:
+            if proc.returncode is None:
+                proc.terminate()
+
+        async def stop(proc) :
+            try:
+                await asyncio.wait_for(proc.wait(), timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+
+        await asyncio.gather(*(stop(proc) for proc in procs), return_exceptions=True)
+        await asyncio.gather(*self._watchers, return_exceptions=True)
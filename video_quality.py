@@ -0,0 +1,79 @@
+import os
+import time
+from   video_transform import VIDEO_INTERPOLATION
+
+
+VIDEO_ADAPTIVE      = os.getenv("VIDEO_ADAPTIVE", "on")                  # "on" or "off"
+VIDEO_QUALITY_DOWN  = float(os.getenv("VIDEO_QUALITY_DOWN", "0.85"))     # step down above this share of the frame interval
+VIDEO_QUALITY_UP    = float(os.getenv("VIDEO_QUALITY_UP", "0.40"))       # step up below this share
+VIDEO_QUALITY_HOLD  = float(os.getenv("VIDEO_QUALITY_HOLD", "2.0"))      # seconds between changes
+
+QUALITY_LEVELS = [
+    # (output fps, interpolation, re-write duplicate frames)
+    (30, VIDEO_INTERPOLATION, True ),
+    (30, "linear"           , False),
+    (20, "linear"           , False),
+    (15, "nearest"          , False),
+    (10, "nearest"          , False),
+]
+
+
+class VideoQuality :
+    """Steps a bot's video output down when writing falls behind, and back up when it keeps up.
+
+    observe() is fed the time each frame took to convert and write. The
+    load is that time as a share of the current frame interval, smoothed
+    over roughly a second of frames. Above `down` the output frame rate and
+    interpolation step down one level; below `up` for `hold` seconds they
+    step back up. Levels change at most once per `hold` seconds.
+    """
+
+    def __init__(self, buffer, levels=QUALITY_LEVELS, down=VIDEO_QUALITY_DOWN, up=VIDEO_QUALITY_UP,
+                 hold=VIDEO_QUALITY_HOLD, enabled=(VIDEO_ADAPTIVE == "on")) :
+        self.buffer   = buffer
+        self.levels   = levels
+        self.down     = down
+        self.up       = up
+        self.hold     = hold
+        self.enabled  = enabled
+        self.level    = 0
+        self.load     = 0.0
+        self.changes  = 0
+        self._changed = time.monotonic()
+        self._last    = 0.0        # monotonic time of the last write
+        self._apply()
+
+    @property
+    def rewrite_duplicates(self) :
+        return self.levels[self.level][2]
+
+    def due(self) :
+        # queue-driven writers: hold back frames that come faster than the current level's rate
+        return time.monotonic() - self._last >= self.buffer.interval * 0.9
+
+    def observe(self, busy) :
+        now        = time.monotonic()
+        self._last = now
+        if not self.enabled :
+            return
+        alpha      = min(1.0, 1.0 / self.levels[self.level][0])
+        self.load += alpha * ( busy / self.buffer.interval - self.load )
+        if now - self._changed < self.hold :
+            return
+        if self.load > self.down and self.level < len(self.levels) - 1 :
+            self._step(1, now)
+        elif self.load < self.up and self.level > 0 :
+            self._step(-1, now)
+
+    def _step(self, direction, now) :
+        self.level   += direction
+        self.changes += 1
+        self._changed = now
+        self._apply()
+        fps, interpolation, _ = self.levels[self.level]
+        print(f"video quality {'down' if direction > 0 else 'up'} to level {self.level}: {fps} fps, {interpolation} (load {self.load:.2f})")
+
+    def _apply(self) :
+        fps, interpolation, _ = self.levels[self.level]
+        self.buffer.set_quality(fps, interpolation)
+        self.buffer.metrics.quality_level = self.level
@@ -0,0 +1,137 @@
+import os
+import numpy as np
+from   silence import BYTES_PER_PIXEL
+
+
+# cv2 constant names, resolved when the first plan is built
+INTERPOLATION = {
+    "nearest" : "INTER_NEAREST",
+    "linear"  : "INTER_LINEAR",
+    "area"    : "INTER_AREA",
+    "cubic"   : "INTER_CUBIC",
+    "lanczos" : "INTER_LANCZOS4",
+}
+
+ROTATION = {
+    None : None,
+    0    : None,
+    90   : "ROTATE_90_CLOCKWISE",
+    180  : "ROTATE_180",
+    270  : "ROTATE_90_COUNTERCLOCKWISE",
+}
+
+COLOR_CONVERSION = {
+    ("BGRA", "RGBA") : "COLOR_BGRA2RGBA",
+    ("RGBA", "BGRA") : "COLOR_RGBA2BGRA",
+    ("RGB" , "RGBA") : "COLOR_RGB2RGBA",
+    ("BGR" , "RGBA") : "COLOR_BGR2RGBA",
+    ("RGB" , "BGRA") : "COLOR_RGB2BGRA",
+    ("BGR" , "BGRA") : "COLOR_BGR2BGRA",
+}
+
+VIDEO_INTERPOLATION = os.getenv("VIDEO_INTERPOLATION", "area")
+
+_cv2 = None
+
+
+def load_cv2() :
+    # cv2 is the slowest import a bot has; only processes that convert video pay for it
+    global _cv2
+    if _cv2 is None :
+        import cv2
+        _cv2 = cv2
+    return _cv2
+
+
+class TransformPlan :
+    """Precomputed convert/resize/rotate steps for one source frame shape.
+
+    Intermediate and output images are allocated once and reused for
+    every frame of that shape.
+    """
+
+    def __init__(self, src_width, src_height, src_format, dst_width, dst_height, dst_format, interpolation="area", rotate=None) :
+        cv2 = self._cv2    = load_cv2()
+        self.src_shape     = (src_height, src_width, BYTES_PER_PIXEL[src_format])
+        self.interpolation = getattr(cv2, INTERPOLATION[interpolation])
+        self.rotation      = getattr(cv2, ROTATION[rotate]) if ROTATION[rotate] else None
+
+        if src_format == dst_format :
+            self.conversion = None
+        elif (src_format, dst_format) in COLOR_CONVERSION :
+            self.conversion = getattr(cv2, COLOR_CONVERSION[(src_format, dst_format)])
+        else :
+            raise ValueError(f"Unsupported color conversion {src_format} -> {dst_format}")
+
+        channels = BYTES_PER_PIXEL[dst_format]
+        self._converted = None
+        if self.conversion is not None :
+            self._converted = np.empty((src_height, src_width, channels), dtype=np.uint8)
+
+        # resize happens before rotation, so a quarter turn resizes to the transposed size
+        if rotate in (90, 270) :
+            resize_width, resize_height = dst_height, dst_width
+        else :
+            resize_width, resize_height = dst_width, dst_height
+
+        self.resize_size = (resize_width, resize_height)
+        self._resized    = None
+        if (src_width, src_height) != self.resize_size :
+            self._resized = np.empty((resize_height, resize_width, channels), dtype=np.uint8)
+
+        self._rotated = None
+        if self.rotation is not None :
+            self._rotated = np.empty((dst_height, dst_width, channels), dtype=np.uint8)
+
+    def identity(self) :
+        return self.conversion is None and self._resized is None and self._rotated is None
+
+    def apply(self, buffer) :
+        cv2   = self._cv2
+        image = np.frombuffer(buffer, dtype=np.uint8).reshape(self.src_shape)
+        if self.conversion is not None :
+            image = cv2.cvtColor(image, self.conversion, dst=self._converted)
+        if self._resized is not None :
+            image = cv2.resize(image, self.resize_size, dst=self._resized, interpolation=self.interpolation)
+        if self._rotated is not None :
+            image = cv2.rotate(image, self.rotation, dst=self._rotated)
+        return image.tobytes()
+
+
+class VideoTransform :
+    """Maps incoming VideoFrames to the virtual camera's size and format.
+
+    Frames that already have the camera's size and format are passed
+    through untouched: their bytes go straight to write_frame. Other
+    frames use plans cached per (source size, source format), so each bot
+    pays for plan setup once per distinct incoming shape. A VideoTransform
+    reuses its output buffers and must only be used from one thread.
+    """
+
+    def __init__(self, width, height, color_format="RGBA", interpolation=VIDEO_INTERPOLATION, rotate=None) :
+        self.width         = width
+        self.height        = height
+        self.color_format  = color_format
+        self.interpolation = interpolation
+        self.rotate        = rotate
+        self.passthrough   = 0      # frames handed over without conversion
+        self._plans        = {}
+
+    def matches(self, frame) :
+        return (frame.width == self.width and frame.height == self.height
+                and frame.color_format == self.color_format and not self.rotate)
+
+    def plan(self, src_width, src_height, src_format) :
+        key  = (src_width, src_height, src_format, self.interpolation)
+        plan = self._plans.get(key)
+        if plan is None :
+            plan = TransformPlan(src_width, src_height, src_format, self.width, self.height, self.color_format,
+                                 interpolation=self.interpolation, rotate=self.rotate)
+            self._plans[key] = plan
+        return plan
+
+    def apply(self, frame) :
+        if self.matches(frame) and isinstance(frame.buffer, bytes) :
+            self.passthrough += 1
+            return frame.buffer
+        return self.plan(frame.width, frame.height, frame.color_format).apply(frame.buffer)